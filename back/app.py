@@ -15,32 +15,44 @@ from feature.electronCapture.routes import electron_capture_bp
 from feature.constructionSchedule.routes import construction_schedule_bp
 from feature.userService.routes import user_service_bp
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")
-CORS(app, supports_credentials=True, origins=["http://localhost:3000"])  # React からのアクセス許可
+def create_app():
+    """
+    アプリケーションを作成
 
-login_manager = LoginManager()
-login_manager.init_app(app)
+    モジュールの読み込み時には作成しない（bulk_users のハッシュ計算プールは spawn で子プロセスを
+    起動し、子プロセスは起動スクリプトを __mp_main__ として読み込み直すため、読み込み時に作成すると
+    init_db や各 Blueprint の record_once（キャプチャワーカーのプール・掃除スレッド・
+    トークン更新スケジューラー）が子プロセスごとに実行されてしまう）。
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")
+    CORS(app, supports_credentials=True, origins=["http://localhost:3000"])  # React からのアクセス許可
 
-# Flask 3 では app に login_manager を明示的に登録
-app.login_manager = login_manager
+    login_manager = LoginManager()
+    login_manager.init_app(app)
 
-init_db(app)
+    # Flask 3 では app に login_manager を明示的に登録
+    app.login_manager = login_manager
 
-# user_loader の登録
-@login_manager.user_loader
-def user_loader(user_id):
-    return load_user(user_id)
+    init_db(app)
+
+    # user_loader の登録
+    @login_manager.user_loader
+    def user_loader(user_id):
+        return load_user(user_id)
+
+    # ルート
+    app.register_blueprint(crm_bp)
+    app.register_blueprint(login_bp)
+    app.register_blueprint(trend_search_bp)
+    app.register_blueprint(three_d_bp)
+    app.register_blueprint(session_sync_bp)
+    app.register_blueprint(electron_capture_bp)
+    app.register_blueprint(construction_schedule_bp)
+    app.register_blueprint(user_service_bp)
+
+    return app
 
-# ルート
-app.register_blueprint(crm_bp)
-app.register_blueprint(login_bp)
-app.register_blueprint(trend_search_bp)
-app.register_blueprint(three_d_bp)
-app.register_blueprint(session_sync_bp)
-app.register_blueprint(electron_capture_bp)
-app.register_blueprint(construction_schedule_bp)
-app.register_blueprint(user_service_bp)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,85 @@
+"""
+キャプチャセッション開始（start-electron-capture）のレイテンシ計測
+
+Node.js / npm の確認結果を毎回破棄する場合（キャッシュ導入前と同じ動作）と、
+キャッシュを使う場合とで比較する。あわせて、キャプチャワーカーをセッションごとに
+起動する場合と、起動済みワーカーのプールから取り出す場合とを比較する。
+
+実行方法（back ディレクトリで）:
+    python -m benchmarks.bench_capture_start [回数]
+"""
+import statistics
+import sys
+import time
+
+from flask import Flask
+from flask_login import LoginManager
+
+from feature.electronCapture.routes import electron_capture_bp
+from feature.electronCapture.supervisor import CaptureSupervisor
+from feature.electronCapture.toolchain import toolchain_probe
+
+
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: None)
+    app.register_blueprint(electron_capture_bp)
+    return app
+
+
+def measure(client, iterations: int, cold: bool) -> list:
+    latencies = []
+    for _ in range(iterations):
+        if cold:
+            toolchain_probe.invalidate()
+        started = time.perf_counter()
+        response = client.post('/api/service/3d/start-electron-capture', json={})
+        latencies.append((time.perf_counter() - started) * 1000)
+        # ユーザーごとの上限に掛からないよう停止しておく
+        client.post(f"/api/service/3d/stop-capture/{response.get_json()['session_id']}")
+    return latencies
+
+
+def measure_workers(supervisor: CaptureSupervisor, iterations: int, wait_for_pool: bool) -> list:
+    latencies = []
+    for i in range(iterations):
+        if wait_for_pool:
+            # 保守スレッドがプールを補充するのを待つ（補充はリクエスト外で行われる）
+            while supervisor.stats()['idle'] < supervisor.pool_size:
+                time.sleep(0.01)
+        session_id = f'bench-{i}'
+        started = time.perf_counter()
+        supervisor.acquire(session_id, {'session_id': session_id})
+        latencies.append((time.perf_counter() - started) * 1000)
+        supervisor.release(session_id)
+    return latencies
+
+
+def report(label: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{label:<28} avg {statistics.mean(latencies):8.2f} ms  p50 {statistics.median(latencies):8.2f} ms  p95 {p95:8.2f} ms")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    client = create_app().test_client()
+
+    report('probe every start (before)', measure(client, iterations, cold=True))
+    toolchain_probe.refresh()
+    report('cached probe (after)', measure(client, iterations, cold=False))
+
+    # 1 回ごとに破棄するワーカー（プールなし）= セッションごとにプロセスを起動
+    spawning = CaptureSupervisor(pool_size=0, max_sessions=1)
+    report('spawn worker per session', measure_workers(spawning, iterations, wait_for_pool=False))
+    pooled = CaptureSupervisor(pool_size=2)
+    pooled.start()
+    report('warm worker pool', measure_workers(pooled, iterations, wait_for_pool=True))
+    spawning.shutdown()
+    pooled.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+操作イベント暗号化のスループット計測
+
+1 セッションあたり 60Hz の操作ストリーム（1 秒に 60 イベント）を維持できるかを確認する。
+SessionCipher を使い回す場合と、イベントごとに鍵導出からやり直す場合とを比較し、
+1 ワーカーで同時に 60Hz を維持できるセッション数の目安を表示する。
+
+実行方法（back ディレクトリで）:
+    python -m benchmarks.bench_interaction_cipher [回数]
+"""
+import sys
+import time
+
+from feature.electronCapture.cipher import SessionCipher
+
+SECRET_KEY = 'bench-secret'
+SESSION_ID = 'bench-session-0001'
+TARGET_HZ = 60
+
+INTERACTION = {
+    'type': 'mousemove',
+    'target': '#canvas',
+    'data': {'x': 640, 'y': 360, 'buttons': 0},
+    'timestamp': '2024-01-01T00:00:00.000000',
+    'encrypted': True
+}
+
+
+def measure(encrypt, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encrypt(INTERACTION)
+    return iterations / (time.perf_counter() - started)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    cipher = SessionCipher(SECRET_KEY, SESSION_ID)
+
+    reused = measure(cipher.encrypt, iterations)
+    rederived = measure(lambda i: SessionCipher(SECRET_KEY, SESSION_ID).encrypt(i), iterations // 10)
+
+    frame = cipher.encrypt(INTERACTION)
+    assert cipher.decrypt(frame) == INTERACTION
+
+    print(f"iterations: {iterations}")
+    print(f"frame size: {len(frame)} bytes")
+    print(f"reused cipher:    {reused:,.0f} events/sec (~{reused / TARGET_HZ:,.0f} sessions at {TARGET_HZ}Hz)")
+    print(f"per-event derive: {rederived:,.0f} events/sec (~{rederived / TARGET_HZ:,.0f} sessions at {TARGET_HZ}Hz)")
+
+
+if __name__ == '__main__':
+    main()
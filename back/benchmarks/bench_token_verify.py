@@ -0,0 +1,54 @@
+"""
+キャプチャトークン検証のスループット計測
+
+キャッシュ導入前と同じ処理（毎回 base64 デコードと HMAC を計算）と、
+TokenVerifier（初回のみ計算し以降はキャッシュ）とで 1 秒あたりの検証回数を比較する。
+
+実行方法（back ディレクトリで）:
+    python -m benchmarks.bench_token_verify [回数]
+"""
+import base64
+import hashlib
+import hmac
+import sys
+import time
+
+from feature.electronCapture.tokens import TokenVerifier
+
+SECRET_KEY = 'bench-secret'
+
+
+def verify_uncached(token: str):
+    """キャッシュ導入前の verify_token と同じ処理"""
+    decoded = base64.b64decode(token.encode()).decode()
+    user_id, session_id, timestamp, signature = decoded.split(':')
+    message = f"{user_id}:{session_id}:{timestamp}"
+    expected = hmac.new(SECRET_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()
+    if signature != expected or int(timestamp) < time.time() - 86400:
+        return None
+    return {'user_id': user_id, 'session_id': session_id, 'timestamp': int(timestamp)}
+
+
+def measure(verify, token: str, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        assert verify(token) is not None
+    return iterations / (time.perf_counter() - started)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    verifier = TokenVerifier(SECRET_KEY)
+    token = verifier.generate('bench_user', 'bench-session-0001')
+
+    uncached = measure(verify_uncached, token, iterations)
+    cached = measure(verifier.verify, token, iterations)
+
+    print(f"iterations: {iterations}")
+    print(f"uncached: {uncached:,.0f} interactions/sec")
+    print(f"cached:   {cached:,.0f} interactions/sec ({cached / uncached:.1f}x)")
+    print(f"cache stats: {verifier.stats}")
+
+
+if __name__ == '__main__':
+    main()
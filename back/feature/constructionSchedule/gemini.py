@@ -0,0 +1,383 @@
+"""
+工事工程管理機能の Gemini（Vertex AI）呼び出しヘルパー
+
+- サービスアカウント認証情報と genai.Client はプロセス内で一度だけ生成して使い回す
+  （認証情報はアクセストークンの期限切れ時のみ google-auth が自動更新する）
+- 同一のプロジェクト＋工程内容に対する分析結果はハッシュキーでキャッシュする
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from google import genai
+from google.oauth2 import service_account
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SA_KEY_PATH = os.path.abspath(os.path.join(BASE_DIR, "..", "..", "config", "service-account.json"))
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# 応答キャッシュ設定
+RESPONSE_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("GEMINI_CACHE_MAX_ENTRIES", "256"))
+
+# サーバー側で工程を要約する際のトークン予算（日本語は概ね1文字≒1トークンで見積もる）
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("GEMINI_PROMPT_TOKEN_BUDGET", "4000"))
+# クライアントが指定できるトークン予算の下限（上限は DEFAULT_TOKEN_BUDGET）
+MIN_TOKEN_BUDGET = 500
+DESCRIPTION_MAX_CHARS = 80
+MIN_DESCRIPTION_CHARS = 20
+
+# 生成処理を実行するワーカースレッド数（リクエストワーカーを占有しないため）
+GENERATION_WORKERS = int(os.environ.get("GEMINI_GENERATION_WORKERS", "4"))
+# ストリーミング中にチャンクを待つ最大秒数
+STREAM_CHUNK_TIMEOUT = int(os.environ.get("GEMINI_STREAM_CHUNK_TIMEOUT", "120"))
+
+
+# ============================================
+# クライアント管理（プロセス共有・遅延生成）
+# ============================================
+_client_lock = threading.Lock()
+_credentials = None
+_clients = {}
+
+
+def _get_credentials():
+    """サービスアカウント認証情報を取得（初回のみファイルを読み込む）"""
+    global _credentials
+    if _credentials is None:
+        _credentials = service_account.Credentials.from_service_account_file(
+            SA_KEY_PATH,
+            scopes=SCOPES
+        )
+    return _credentials
+
+
+def get_gemini_client(project_id: str = None, location: str = None):
+    """
+    Vertex AI 用の genai.Client を取得
+
+    (project_id, location) ごとに一つだけ生成し、以降は同じクライアント
+    （＝同じ HTTP コネクションプールと認証情報）を再利用する。
+    """
+    project_id = project_id or os.environ["GCP_PROJECT"]
+    location = location or os.environ["GCP_LOCATION"]
+    key = (project_id, location)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _client_lock:
+        # ロック待ちの間に他スレッドが生成済みの場合はそれを使う
+        client = _clients.get(key)
+        if client is None:
+            client = genai.Client(
+                vertexai=True,   # Vertex AI 経由
+                project=project_id,
+                location=location,
+                credentials=_get_credentials()
+            )
+            _clients[key] = client
+    return client
+
+
+def reset_gemini_clients():
+    """キャッシュ済みのクライアントと認証情報を破棄（鍵ローテーション時など）"""
+    global _credentials
+    with _client_lock:
+        _clients.clear()
+        _credentials = None
+
+
+# ============================================
+# 応答キャッシュ
+# ============================================
+class ResponseCache:
+    """TTL 付き・件数上限付きの LRU キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+
+# プロンプトに影響する工程フィールド
+MILESTONE_PROMPT_FIELDS = ('name', 'description', 'start_date', 'end_date', 'progress_percentage', 'assigned_to')
+
+
+def make_cache_key(project: dict, milestones: list) -> str:
+    """プロジェクト＋工程内容から応答キャッシュのキーを生成"""
+    payload = {
+        'model': GEMINI_MODEL,
+        'project': {
+            'name': project.get('name'),
+            'description': project.get('description')
+        },
+        'milestones': [
+            {field: m.get(field) for field in MILESTONE_PROMPT_FIELDS}
+            for m in milestones
+        ]
+    }
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+# ============================================
+# プロンプト生成・呼び出し
+# ============================================
+def build_proposal_prompt(project: dict, milestones: list) -> str:
+    """AI導入提案用のプロンプトを組み立てる"""
+    project_info = f"""
+■プロジェクト情報
+- 名称: {project['name']}
+- 概要: {project['description']}
+"""
+
+    milestones_text = ""
+    for i, m in enumerate(milestones, start=1):
+        milestones_text += f"""
+{i}. {m.get('name', '名称なし')}
+   説明: {m.get('description', '')}
+   期間: {m.get('start_date', '')} 〜 {m.get('end_date', '')}
+   進捗: {m.get('progress_percentage', '0')}%
+   担当: {m.get('assigned_to', '未割当')}
+"""
+
+    return build_prompt_from_sections(project_info, milestones_text)
+
+
+def build_prompt_from_sections(project_info: str, milestones_text: str) -> str:
+    """プロジェクト情報・工程一覧のテキストを提案用プロンプトに埋め込む"""
+    return f"""
+あなたは建設系クライアント向けにAI導入提案資料をつくる専門コンサルタントです。
+
+【出力ルール】
+- 重要なポイントを “最大4セクション” にまとめる
+- 各セクションは以下の4要素だけを書く：
+  ① 一言タイトル  
+  ② 効果（数字必須）  
+  ③ 実際に何ができるか（3〜4つ以内）  
+  ④ 導入ハードル（短く）
+- 箇条書きは最大4つまで
+- 専門用語よりも読みやすさ優先
+- 新規事業の役員に説明する前提で簡潔に
+- 全体の文章量は 600〜900文字以内
+- 表や区切り線などを使わず、シンプルな見た目にする
+
+---
+
+【プロジェクト情報】
+{project_info}
+
+【マイルストーン一覧】
+{milestones_text}
+---
+
+建設現場の実運用を意識し、
+「どこに AI を入れると工数が一番削減できるか」を実務者視点で分析してください。
+"""
+
+
+def generate_proposal(project: dict, milestones: list) -> tuple[str, bool]:
+    """
+    AI導入提案を生成
+
+    Returns:
+        (生成テキスト, キャッシュヒットしたかどうか)
+    """
+    cache_key = make_cache_key(project, milestones)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    client = get_gemini_client()
+    result = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=build_proposal_prompt(project, milestones)
+    )
+
+    response_cache.set(cache_key, result.text)
+    return result.text, False
+
+
+# ============================================
+# サーバー側要約（トークン予算付き）
+# ============================================
+STATUS_LABELS = {
+    'not_started': '未着手',
+    'in_progress': '進行中',
+    'completed': '完了',
+    'delayed': '遅延',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語主体のため文字数で見積もる）"""
+    return len(text)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if not text or max_chars <= 0:
+        return ''
+    text = ' '.join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+def _format_milestone_line(m: dict, description_chars: int) -> str:
+    line = (
+        f"- {m['name']} | {m['start_date']}〜{m['end_date']}"
+        f" | {m.get('progress_percentage') or 0}% | {m.get('assigned_to') or '未割当'}"
+    )
+    description = _truncate(m.get('description'), description_chars)
+    if description:
+        line += f" | {description}"
+    return line
+
+
+def build_compact_milestones_text(milestones: list, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    工程一覧をステータス別にグループ化し、トークン予算内に収まる要約テキストを作る
+
+    予算を超える場合は、まず説明文を短くし、それでも収まらなければ
+    各グループの末尾の工程を「他 N 件」にまとめる。
+    milestones は表示順に並んだ dict（start_date/end_date は 'YYYY-MM-DD' 文字列）。
+    """
+    groups = OrderedDict((status, []) for status in STATUS_LABELS)
+    for m in milestones:
+        groups.setdefault(m.get('status') or 'not_started', []).append(m)
+    groups = OrderedDict((status, items) for status, items in groups.items() if items)
+
+    def render(description_chars: int, limit_per_group: int) -> str:
+        sections = []
+        for status, items in groups.items():
+            label = STATUS_LABELS.get(status, status)
+            lines = [f"■{label}（{len(items)}件）"]
+            lines.extend(_format_milestone_line(m, description_chars) for m in items[:limit_per_group])
+            if len(items) > limit_per_group:
+                lines.append(f"- 他 {len(items) - limit_per_group} 件")
+            sections.append('\n'.join(lines))
+        return '\n'.join(sections)
+
+    max_group = max((len(items) for items in groups.values()), default=0)
+
+    # 説明文を段階的に短くする
+    description_chars = DESCRIPTION_MAX_CHARS
+    while description_chars >= MIN_DESCRIPTION_CHARS:
+        text = render(description_chars, max_group)
+        if estimate_tokens(text) <= token_budget:
+            return text
+        description_chars //= 2
+
+    # 説明文を省略し、グループごとの件数を二分探索で絞る
+    low, high = 0, max_group
+    best = render(0, 0)
+    while low <= high:
+        mid = (low + high) // 2
+        text = render(0, mid)
+        if estimate_tokens(text) <= token_budget:
+            best = text
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+def build_compact_proposal_prompt(project: dict, milestones: list, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """DBから読み込んだプロジェクト・工程から要約版プロンプトを組み立てる"""
+    project_info = f"""
+■プロジェクト情報
+- 名称: {project['name']}
+- 概要: {_truncate(project.get('description'), DESCRIPTION_MAX_CHARS * 4)}
+- 期間: {project.get('start_date') or '未定'} 〜 {project.get('end_date') or '未定'}
+- 工程数: {len(milestones)}
+"""
+    milestones_text = build_compact_milestones_text(milestones, token_budget)
+    return build_prompt_from_sections(project_info, milestones_text)
+
+
+# ============================================
+# ストリーミング生成（専用スレッドで実行）
+# ============================================
+_generation_executor = ThreadPoolExecutor(
+    max_workers=GENERATION_WORKERS,
+    thread_name_prefix='gemini-generation'
+)
+_STREAM_END = object()
+
+
+def _run_stream(prompt: str, cache_key: str, chunks: queue.Queue):
+    """ワーカースレッド側: Gemini のストリーム応答をキューに流し、完了後にキャッシュする"""
+    try:
+        client = get_gemini_client()
+        parts = []
+        for chunk in client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt):
+            if chunk.text:
+                parts.append(chunk.text)
+                chunks.put(chunk.text)
+        response_cache.set(cache_key, ''.join(parts))
+        chunks.put(_STREAM_END)
+    except Exception as e:
+        chunks.put(e)
+
+
+def stream_proposal(prompt: str):
+    """
+    プロンプトに対する生成結果をチャンク単位で返すジェネレーター
+
+    生成はワーカースレッドで行い、リクエスト側はキューからチャンクを受け取るだけにする。
+    同じプロンプトの結果がキャッシュにあれば一括で返す。
+
+    Returns:
+        (チャンクのイテレーター, キャッシュヒットしたかどうか)
+    """
+    cache_key = hashlib.sha256(f"{GEMINI_MODEL}:{prompt}".encode('utf-8')).hexdigest()
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return iter([cached]), True
+
+    chunks = queue.Queue()
+    _generation_executor.submit(_run_stream, prompt, cache_key, chunks)
+
+    def iterate():
+        while True:
+            item = chunks.get(timeout=STREAM_CHUNK_TIMEOUT)
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return iterate(), False
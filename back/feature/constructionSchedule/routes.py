@@ -1,24 +1,29 @@
 """
 工事工程管理機能のルート
 """
-import os
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from flask_login import login_required, current_user
-from datetime import datetime
-from models.construction_schedule import Project, Milestone, MilestoneHistory
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, literal_column
+from models.construction_schedule import Project, Milestone, MilestoneHistory, MilestoneTombstone
 from config.db import db
-from langchain_google_genai import ChatGoogleGenerativeAI
-from google import genai
-from google.oauth2 import service_account
-from google.cloud import aiplatform
+from feature.userService.entitlements import require_service
+from .gemini import generate_proposal, build_compact_proposal_prompt, stream_proposal, DEFAULT_TOKEN_BUDGET, MIN_TOKEN_BUDGET
+from .workload import compute_workload, find_overallocations
 
 construction_schedule_bp = Blueprint('construction_schedule', __name__, url_prefix='/api/construction-schedule')
 
+# 作業負荷カレンダーで指定できる最大日数
+WORKLOAD_MAX_DAYS = 1096
+# ポートフォリオで直近の開始予定として指定できる最大日数
+PORTFOLIO_MAX_DAYS = 365
+
 
 # ==================== プロジェクト管理API ====================
 
 @construction_schedule_bp.route('/projects', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_projects():
     """プロジェクト一覧取得（ログインユーザーのみ）"""
     try:
@@ -34,6 +39,7 @@ def get_projects():
 
 @construction_schedule_bp.route('/projects', methods=['POST'])
 @login_required
+@require_service('construction-schedule')
 def create_project():
     """プロジェクト作成（ログインユーザーに紐付け）"""
     try:
@@ -65,6 +71,7 @@ def create_project():
 
 @construction_schedule_bp.route('/projects/<int:project_id>', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_project(project_id):
     """プロジェクト詳細取得（アクセス権チェック）"""
     try:
@@ -87,6 +94,7 @@ def get_project(project_id):
 
 @construction_schedule_bp.route('/projects/<int:project_id>', methods=['PUT'])
 @login_required
+@require_service('construction-schedule')
 def update_project(project_id):
     """プロジェクト更新（アクセス権チェック）"""
     try:
@@ -126,6 +134,7 @@ def update_project(project_id):
 
 @construction_schedule_bp.route('/projects/<int:project_id>', methods=['DELETE'])
 @login_required
+@require_service('construction-schedule')
 def delete_project(project_id):
     """プロジェクト削除（アクセス権チェック）"""
     try:
@@ -150,6 +159,7 @@ def delete_project(project_id):
 
 @construction_schedule_bp.route('/projects/<int:project_id>/milestones', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_milestones(project_id):
     """工程一覧取得（アクセス権チェック）"""
     try:
@@ -170,19 +180,59 @@ def get_milestones(project_id):
 
 @construction_schedule_bp.route('/projects/<int:project_id>/milestones/gantt', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_milestones_gantt(project_id):
-    """ガントチャート用工程データ取得（アクセス権チェック）"""
+    """
+    ガントチャート用工程データ取得（アクセス権チェック）
+    
+    since=<ISO日時> を指定すると、その時刻以降に更新された工程と
+    削除された工程ID（deleted）のみを返す差分同期モードになる。
+    次回のポーリングにはレスポンスの server_time を since に渡す。
+    """
     try:
         # プロジェクトのアクセス権チェック
         project = Project.query.get_or_404(project_id)
         if project.user_id != current_user.id:
             return jsonify({'success': False, 'error': 'アクセス権限がありません'}), 403
         
-        milestones = Milestone.query.filter_by(project_id=project_id).order_by(Milestone.display_order).all()
+        # クエリ実行前の時刻を基準にする（取得中の更新を取りこぼさないため）
+        # DBの日時は秒精度のため、秒未満は切り捨てて境界の更新を重複側に倒す
+        server_time = datetime.utcnow().replace(microsecond=0)
+        
+        since = request.args.get('since')
+        if not since:
+            milestones = Milestone.query.filter_by(project_id=project_id).order_by(Milestone.display_order).all()
+            
+            return jsonify({
+                'success': True,
+                'mode': 'full',
+                'tasks': [m.to_gantt_format() for m in milestones],
+                'server_time': server_time.isoformat()
+            })
+        
+        try:
+            since_dt = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'since の形式が不正です（ISO 8601 形式で指定してください）'}), 400
+        
+        # idx_project_updated (project_id, updated_at) を使った範囲検索
+        milestones = Milestone.query.filter(
+            Milestone.project_id == project_id,
+            Milestone.updated_at >= since_dt
+        ).order_by(Milestone.display_order).all()
+        
+        tombstones = MilestoneTombstone.query.filter(
+            MilestoneTombstone.project_id == project_id,
+            MilestoneTombstone.deleted_at >= since_dt
+        ).all()
         
         return jsonify({
             'success': True,
-            'tasks': [m.to_gantt_format() for m in milestones]
+            'mode': 'delta',
+            'since': since_dt.isoformat(),
+            'tasks': [m.to_gantt_format() for m in milestones],
+            'deleted': [str(t.milestone_id) for t in tombstones],
+            'server_time': server_time.isoformat()
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -190,6 +240,7 @@ def get_milestones_gantt(project_id):
 
 @construction_schedule_bp.route('/milestones', methods=['POST'])
 @login_required
+@require_service('construction-schedule')
 def create_milestone():
     """工程作成（アクセス権チェック）"""
     try:
@@ -234,6 +285,7 @@ def create_milestone():
 
 @construction_schedule_bp.route('/milestones/<int:milestone_id>', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_milestone(milestone_id):
     """工程詳細取得（アクセス権チェック）"""
     try:
@@ -254,6 +306,7 @@ def get_milestone(milestone_id):
 
 @construction_schedule_bp.route('/milestones/<int:milestone_id>', methods=['PUT'])
 @login_required
+@require_service('construction-schedule')
 def update_milestone(milestone_id):
     """工程更新（ドラッグ&ドロップ時も使用、アクセス権チェック）"""
     try:
@@ -333,6 +386,7 @@ def update_milestone(milestone_id):
 
 @construction_schedule_bp.route('/milestones/<int:milestone_id>', methods=['DELETE'])
 @login_required
+@require_service('construction-schedule')
 def delete_milestone(milestone_id):
     """工程削除（アクセス権チェック）"""
     try:
@@ -342,6 +396,12 @@ def delete_milestone(milestone_id):
         project = Project.query.get(milestone.project_id)
         if not project or project.user_id != current_user.id:
             return jsonify({'success': False, 'error': 'アクセス権限がありません'}), 403
+        
+        # 差分同期クライアント向けに削除を記録
+        db.session.add(MilestoneTombstone(
+            project_id=milestone.project_id,
+            milestone_id=milestone.id
+        ))
         db.session.delete(milestone)
         db.session.commit()
         
@@ -356,6 +416,7 @@ def delete_milestone(milestone_id):
 
 @construction_schedule_bp.route('/milestones/<int:milestone_id>/reorder', methods=['PUT'])
 @login_required
+@require_service('construction-schedule')
 def reorder_milestone(milestone_id):
     """表示順序変更（アクセス権チェック）"""
     try:
@@ -380,10 +441,221 @@ def reorder_milestone(milestone_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# ==================== ポートフォリオAPI ====================
+
+@construction_schedule_bp.route('/portfolio', methods=['GET'])
+@login_required
+@require_service('construction-schedule')
+def get_portfolio():
+    """
+    全プロジェクト横断のダッシュボード集計（ログインユーザーのみ）
+    
+    クエリパラメータ:
+        days: 直近の開始予定工程として扱う日数（0〜365、デフォルト14）
+        status: プロジェクトステータスでの絞り込み（任意）
+    """
+    try:
+        try:
+            days = int(request.args.get('days', 14))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'days は整数で指定してください'}), 400
+        if not 0 <= days <= PORTFOLIO_MAX_DAYS:
+            return jsonify({'success': False, 'error': f'days は0〜{PORTFOLIO_MAX_DAYS}の範囲で指定してください'}), 400
+        project_status = request.args.get('status')
+        now = datetime.utcnow()
+        horizon = now + timedelta(days=days)
+        
+        # 1. 対象プロジェクト（idx_user_id / idx_status）
+        projects_query = Project.query.filter(Project.user_id == current_user.id)
+        if project_status:
+            projects_query = projects_query.filter(Project.status == project_status)
+        projects = projects_query.order_by(Project.start_date).all()
+        project_ids = [p.id for p in projects]
+        
+        if not project_ids:
+            return jsonify({
+                'success': True,
+                'generated_at': now.isoformat(),
+                'projects': [],
+                'upcoming_milestones': [],
+                'resource_load': [],
+                'summary': {'projects_count': 0, 'milestones_count': 0, 'delayed_count': 0}
+            })
+        
+        # 期間（秒）で重み付けした進捗率。開始＝終了の工程も 1 秒として数える
+        duration = func.greatest(
+            func.timestampdiff(literal_column('SECOND'), Milestone.start_date, Milestone.end_date), 1
+        )
+        is_delayed = db.or_(
+            Milestone.status == 'delayed',
+            db.and_(Milestone.status != 'completed', Milestone.end_date < now)
+        )
+        
+        # 2. プロジェクト別の集計（1クエリ）
+        stats_rows = db.session.query(
+            Milestone.project_id,
+            func.count(Milestone.id).label('milestones_count'),
+            func.sum(case((Milestone.status == 'completed', 1), else_=0)).label('completed_count'),
+            func.sum(case((is_delayed, 1), else_=0)).label('delayed_count'),
+            (func.sum(Milestone.progress_percentage * duration) / func.sum(duration)).label('weighted_progress')
+        ).filter(
+            Milestone.project_id.in_(project_ids)
+        ).group_by(Milestone.project_id).all()
+        stats = {row.project_id: row for row in stats_rows}
+        
+        # 3. 直近 N 日以内に開始予定の工程（idx_dates）
+        upcoming_rows = db.session.query(
+            Milestone.id,
+            Milestone.project_id,
+            Milestone.name,
+            Milestone.start_date,
+            Milestone.end_date,
+            Milestone.status,
+            Milestone.assigned_to
+        ).filter(
+            Milestone.start_date >= now,
+            Milestone.start_date <= horizon,
+            Milestone.status != 'completed',
+            Milestone.project_id.in_(project_ids)
+        ).order_by(Milestone.start_date).all()
+        
+        # 4. 担当者別の負荷（未完了の工程）
+        is_active_in_window = db.and_(Milestone.start_date <= horizon, Milestone.end_date >= now)
+        load_rows = db.session.query(
+            Milestone.assigned_to,
+            func.count(Milestone.id).label('open_count'),
+            func.sum(case((Milestone.status == 'in_progress', 1), else_=0)).label('in_progress_count'),
+            func.sum(case((is_delayed, 1), else_=0)).label('delayed_count'),
+            func.sum(case((is_active_in_window, 1), else_=0)).label('active_in_window_count'),
+            func.count(func.distinct(Milestone.project_id)).label('projects_count')
+        ).filter(
+            Milestone.status != 'completed',
+            Milestone.project_id.in_(project_ids)
+        ).group_by(Milestone.assigned_to).all()
+        
+        project_names = {p.id: p.name for p in projects}
+        project_list = []
+        for p in projects:
+            row = stats.get(p.id)
+            project_list.append({
+                'id': p.id,
+                'name': p.name,
+                'status': p.status,
+                'client_name': p.client_name,
+                'start_date': p.start_date.isoformat() if p.start_date else None,
+                'end_date': p.end_date.isoformat() if p.end_date else None,
+                'milestones_count': int(row.milestones_count) if row else 0,
+                'completed_count': int(row.completed_count or 0) if row else 0,
+                'delayed_count': int(row.delayed_count or 0) if row else 0,
+                'progress_percentage': round(float(row.weighted_progress), 1) if row and row.weighted_progress is not None else 0
+            })
+        
+        return jsonify({
+            'success': True,
+            'generated_at': now.isoformat(),
+            'days': days,
+            'projects': project_list,
+            'upcoming_milestones': [{
+                'id': row.id,
+                'project_id': row.project_id,
+                'project_name': project_names.get(row.project_id),
+                'name': row.name,
+                'start_date': row.start_date.isoformat(),
+                'end_date': row.end_date.isoformat(),
+                'status': row.status,
+                'assigned_to': row.assigned_to
+            } for row in upcoming_rows],
+            'resource_load': sorted([{
+                'assigned_to': row.assigned_to or '未割当',
+                'open_count': int(row.open_count),
+                'in_progress_count': int(row.in_progress_count or 0),
+                'delayed_count': int(row.delayed_count or 0),
+                'active_in_window_count': int(row.active_in_window_count or 0),
+                'projects_count': int(row.projects_count)
+            } for row in load_rows], key=lambda r: r['open_count'], reverse=True),
+            'summary': {
+                'projects_count': len(project_list),
+                'milestones_count': sum(p['milestones_count'] for p in project_list),
+                'delayed_count': sum(p['delayed_count'] for p in project_list)
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@construction_schedule_bp.route('/workload', methods=['GET'])
+@login_required
+@require_service('construction-schedule')
+def get_workload():
+    """
+    担当者別の作業負荷カレンダー（ログインユーザーの全プロジェクト横断）
+    
+    クエリパラメータ:
+        start: 集計開始日 YYYY-MM-DD（デフォルト今日）
+        end: 集計終了日 YYYY-MM-DD（デフォルト start から30日間）
+        threshold: 1日あたりの同時アサイン上限（1以上、これを超えると過負荷、デフォルト1）
+    """
+    try:
+        try:
+            window_start = datetime.fromisoformat(request.args['start']).date() if request.args.get('start') else datetime.now().date()
+            window_end = datetime.fromisoformat(request.args['end']).date() if request.args.get('end') else window_start + timedelta(days=29)
+            threshold = int(request.args.get('threshold', 1))
+        except (ValueError, OverflowError):
+            # 日付の形式誤り、または終了日の既定値が日付の上限を超える場合
+            return jsonify({'success': False, 'error': 'パラメータの形式が不正です'}), 400
+        if threshold < 1:
+            return jsonify({'success': False, 'error': 'threshold は1以上で指定してください'}), 400
+        
+        n_days = (window_end - window_start).days + 1
+        if n_days <= 0:
+            return jsonify({'success': False, 'error': 'end は start 以降の日付を指定してください'}), 400
+        if n_days > WORKLOAD_MAX_DAYS:
+            return jsonify({'success': False, 'error': f'集計期間は最大{WORKLOAD_MAX_DAYS}日です'}), 400
+        
+        # 集計期間と重なる工程のみ取得（idx_dates）
+        rows = db.session.query(
+            Milestone.assigned_to,
+            Milestone.start_date,
+            Milestone.end_date
+        ).join(Project, Project.id == Milestone.project_id).filter(
+            Project.user_id == current_user.id,
+            Milestone.start_date < datetime.combine(window_end + timedelta(days=1), datetime.min.time()),
+            Milestone.end_date >= datetime.combine(window_start, datetime.min.time())
+        ).all()
+        
+        assignees = [row[0] for row in rows]
+        starts = [row[1] for row in rows]
+        ends = [row[2] for row in rows]
+        
+        labels, counts = compute_workload(assignees, starts, ends, window_start, window_end)
+        dates = [(window_start + timedelta(days=i)).isoformat() for i in range(n_days)]
+        
+        heatmap = [{
+            'assigned_to': labels[i],
+            'counts': counts[i].tolist(),
+            'peak': int(counts[i].max()),
+            'busy_days': int((counts[i] > 0).sum())
+        } for i in range(len(labels))]
+        
+        return jsonify({
+            'success': True,
+            'start': window_start.isoformat(),
+            'end': window_end.isoformat(),
+            'threshold': threshold,
+            'dates': dates,
+            'heatmap': heatmap,
+            'overallocated': find_overallocations(labels, counts, dates, threshold),
+            'milestones_count': len(rows)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ==================== 変更履歴API ====================
 
 @construction_schedule_bp.route('/milestones/<int:milestone_id>/history', methods=['GET'])
 @login_required
+@require_service('construction-schedule')
 def get_milestone_history(milestone_id):
     """工程変更履歴取得（アクセス権チェック）"""
     try:
@@ -405,36 +677,12 @@ def get_milestone_history(milestone_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# ============================================
-# Gemini クライアント初期化（Vertex AI 用）
-# ============================================
-def init_gemini_vertex(
-    project_id: str,
-    location: str,
-    service_account_json: str
-):
-    # サービスアカウント読み込み
-    credentials = service_account.Credentials.from_service_account_file(
-        service_account_json,
-        scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-
-    # Cloud (Vertex AI) モードで初期化
-    client = Client(
-        vertexai=True,
-        project=project_id,
-        location=location,
-        credentials=credentials
-    )
-
-    return client
-
-
 # ============================================
 # Gemini へテキストプロンプト送信
 # ============================================
 @construction_schedule_bp.route('/call_gemini', methods=['POST'])
 @login_required
+@require_service('construction-schedule')
 def call_gemini():
     data = request.get_json()
     project = data["project"]
@@ -447,78 +695,88 @@ def call_gemini():
     #         "message": '必須パラメータが足りません。'
     #     })
 
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    SA_KEY_PATH = os.path.join(BASE_DIR, "..", "..", "config", "service-account.json")
-    SA_KEY_PATH = os.path.abspath(SA_KEY_PATH)
-
-    credentials = service_account.Credentials.from_service_account_file(
-        SA_KEY_PATH,
-        scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-
-    client = genai.Client(
-        vertexai=True,   # Vertex AI 経由
-        project=os.environ["GCP_PROJECT"],
-        location=os.environ["GCP_LOCATION"],
-        credentials=credentials
-    )
-    project_info = f"""
-■プロジェクト情報
-- 名称: {project['name']}
-- 概要: {project['description']}
-"""
-
-    milestones_text = ""
-    for i, m in enumerate(milestones, start=1):
-        milestones_text += f"""
-{i}. {m.get('name', '名称なし')}
-   説明: {m.get('description', '')}
-   期間: {m.get('start_date', '')} 〜 {m.get('end_date', '')}
-   進捗: {m.get('progress_percentage', '0')}%
-   担当: {m.get('assigned_to', '未割当')}
-"""
-
-    prompt = f"""
-あなたは建設系クライアント向けにAI導入提案資料をつくる専門コンサルタントです。
-
-【出力ルール】
-- 重要なポイントを “最大4セクション” にまとめる
-- 各セクションは以下の4要素だけを書く：
-  ① 一言タイトル  
-  ② 効果（数字必須）  
-  ③ 実際に何ができるか（3〜4つ以内）  
-  ④ 導入ハードル（短く）
-- 箇条書きは最大4つまで
-- 専門用語よりも読みやすさ優先
-- 新規事業の役員に説明する前提で簡潔に
-- 全体の文章量は 600〜900文字以内
-- 表や区切り線などを使わず、シンプルな見た目にする
-
----
-
-【プロジェクト情報】
-{project_info}
-
-【マイルストーン一覧】
-{milestones_text}
----
-
-建設現場の実運用を意識し、
-「どこに AI を入れると工数が一番削減できるか」を実務者視点で分析してください。
-"""
-
-    # result = llm.invoke(prompt)
-    result = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
+    # クライアントはプロセス内で共有し、同一内容の分析結果はキャッシュから返す
+    text, cached = generate_proposal(project, milestones)
 
     return jsonify({
         'success': True,
-        "message": result.text
+        "message": text,
+        'cached': cached
     })
 
 
+@construction_schedule_bp.route('/projects/<int:project_id>/ai-proposal', methods=['POST'])
+@login_required
+@require_service('construction-schedule')
+def create_ai_proposal(project_id):
+    """
+    AI導入提案を生成（プロジェクト・工程はサーバー側でDBから読み込む）
+    
+    工程はステータス別に要約してトークン予算内に収め、生成結果は
+    text/plain のチャンクとして逐次返す。生成はリクエストワーカーではなく
+    専用スレッドで実行する。
+    """
+    try:
+        project = Project.query.get_or_404(project_id)
+        
+        # アクセス権チェック
+        if project.user_id != current_user.id:
+            return jsonify({'success': False, 'error': 'アクセス権限がありません'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            token_budget = int(data.get('token_budget', DEFAULT_TOKEN_BUDGET))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'token_budget は整数で指定してください'}), 400
+        # 予算を大きくしすぎて要約が効かなくならないよう範囲内に収める
+        token_budget = min(max(token_budget, MIN_TOKEN_BUDGET), DEFAULT_TOKEN_BUDGET)
+        
+        # プロンプトに必要な列のみ取得
+        rows = db.session.query(
+            Milestone.name,
+            Milestone.description,
+            Milestone.start_date,
+            Milestone.end_date,
+            Milestone.status,
+            Milestone.progress_percentage,
+            Milestone.assigned_to
+        ).filter(Milestone.project_id == project_id).order_by(Milestone.display_order).all()
+        
+        milestones = [{
+            'name': row.name,
+            'description': row.description,
+            'start_date': row.start_date.strftime('%Y-%m-%d'),
+            'end_date': row.end_date.strftime('%Y-%m-%d'),
+            'status': row.status,
+            'progress_percentage': row.progress_percentage,
+            'assigned_to': row.assigned_to
+        } for row in rows]
+        
+        prompt = build_compact_proposal_prompt({
+            'name': project.name,
+            'description': project.description,
+            'start_date': project.start_date.isoformat() if project.start_date else None,
+            'end_date': project.end_date.isoformat() if project.end_date else None
+        }, milestones, token_budget)
+        
+        chunks, cached = stream_proposal(prompt)
+        
+        def generate():
+            try:
+                for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                yield f"\n\n[エラー] 提案の生成中にエラーが発生しました: {str(e)}"
+        
+        return Response(generate(), mimetype='text/plain; charset=utf-8', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # nginx でのバッファリングを無効化
+            'X-Proposal-Cache': 'HIT' if cached else 'MISS'
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ==================== テスト用エンドポイント ====================
 
 @construction_schedule_bp.route('/test', methods=['GET'])
@@ -0,0 +1,74 @@
+"""
+担当者別の作業負荷（日別アサイン数）計算
+
+工程の期間を日単位の区間として扱い、差分配列（区間の開始日に +1、終了翌日に -1）
+を累積和することで、日ごとのループを使わずに担当者×日付の件数行列を求める。
+"""
+from datetime import date
+
+import numpy as np
+
+UNASSIGNED_LABEL = '未割当'
+
+
+def compute_workload(assignees, starts, ends, window_start: date, window_end: date):
+    """
+    担当者×日付のアサイン数行列を計算
+
+    Args:
+        assignees: 担当者名の配列（None は未割当として扱う）
+        starts: 工程開始日の配列（datetime / date / datetime64）
+        ends: 工程終了日の配列（終了日当日も稼働日に含める）
+        window_start: 集計期間の開始日
+        window_end: 集計期間の終了日（当日を含む）
+
+    Returns:
+        (担当者名の ndarray, 件数行列 ndarray[担当者数, 日数])
+    """
+    n_days = (window_end - window_start).days + 1
+    if len(assignees) == 0 or n_days <= 0:
+        return np.array([], dtype=object), np.zeros((0, max(n_days, 0)), dtype=np.int32)
+
+    names = np.array([a if a else UNASSIGNED_LABEL for a in assignees], dtype=object)
+    labels, codes = np.unique(names, return_inverse=True)
+
+    origin = np.datetime64(window_start, 'D')
+    start_idx = (np.asarray(starts, dtype='datetime64[s]').astype('datetime64[D]') - origin).astype(np.int64)
+    end_idx = (np.asarray(ends, dtype='datetime64[s]').astype('datetime64[D]') - origin).astype(np.int64)
+
+    # 集計期間にかかる区間だけを残し、期間の端で切り詰める
+    overlaps = (end_idx >= 0) & (start_idx < n_days) & (start_idx <= end_idx)
+    codes = codes[overlaps]
+    start_idx = np.clip(start_idx[overlaps], 0, n_days - 1)
+    end_idx = np.clip(end_idx[overlaps], 0, n_days - 1)
+
+    # 差分配列（各担当者の行に n_days + 1 列）を bincount でまとめて構築
+    width = n_days + 1
+    size = len(labels) * width
+    diff = (
+        np.bincount(codes * width + start_idx, minlength=size)
+        - np.bincount(codes * width + end_idx + 1, minlength=size)
+    ).reshape(len(labels), width)
+
+    counts = np.cumsum(diff[:, :n_days], axis=1).astype(np.int32)
+    return labels, counts
+
+
+def find_overallocations(labels, counts, dates, threshold: int):
+    """
+    同時アサイン数が threshold を超える日を担当者ごとに抽出
+
+    Returns:
+        [{'assigned_to', 'days': [{'date', 'count'}], 'peak'}] のリスト（ピーク降順）
+    """
+    over = counts > threshold
+    flagged = []
+    for row in np.flatnonzero(over.any(axis=1)):
+        day_idx = np.flatnonzero(over[row])
+        flagged.append({
+            'assigned_to': labels[row],
+            'days': [{'date': dates[i], 'count': int(counts[row, i])} for i in day_idx],
+            'peak': int(counts[row].max())
+        })
+    flagged.sort(key=lambda item: item['peak'], reverse=True)
+    return flagged
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_login import current_user, login_required
 from sqlalchemy import func
 from config.db import db
+from feature.userService.entitlements import require_service
 from models.Customer import Customer
 from models.Tag import Tag
 from models.Deal import Deal
@@ -13,6 +14,7 @@ crm_bp = Blueprint("crm", __name__, url_prefix="/api/customers")
 # 一覧（軽量）
 @crm_bp.route("", methods=["GET"])
 @login_required
+@require_service('crm')
 def get_customers_route():
     user_id = current_user.id
     customers = Customer.query.filter_by(user_id=user_id).order_by(Customer.created_at.desc()).all()
@@ -22,6 +24,7 @@ def get_customers_route():
 # POST /customers/create
 @crm_bp.route("/create", methods=["POST"])
 @login_required
+@require_service('crm')
 def create_customer_route():
     data = request.json
 
@@ -68,6 +71,7 @@ def create_customer_route():
 # GET /customers/<id>
 @crm_bp.route("/<int:id>", methods=["GET"])
 @login_required
+@require_service('crm')
 def get_customer_detail_route(id):
     c = Customer.query.get_or_404(id)
     return jsonify(c.to_dict())
@@ -76,6 +80,7 @@ def get_customer_detail_route(id):
 # PUT /customers/<id>
 @crm_bp.route("/<int:id>", methods=["PUT"])
 @login_required
+@require_service('crm')
 def update_customer_route(id):
     data = request.get_json() or {}
     c = Customer.query.get_or_404(id)
@@ -102,6 +107,7 @@ def update_customer_route(id):
 # DELETE /customers/<id>
 @crm_bp.route("/<int:id>", methods=["DELETE"])
 @login_required
+@require_service('crm')
 def delete_customer_route(id):
     c = Customer.query.get_or_404(id)
     db.session.delete(c)
@@ -112,6 +118,7 @@ def delete_customer_route(id):
 # GET /customers/<id>/deals
 @crm_bp.route("/<int:id>/deals", methods=["GET"])
 @login_required
+@require_service('crm')
 def list_deals_route(id):
     Customer.query.get_or_404(id)
     deals = Deal.query.filter_by(customer_id=id).order_by(Deal.created_at.desc()).all()
@@ -119,6 +126,8 @@ def list_deals_route(id):
 
 # POST /customers/<id>/deals
 @crm_bp.route("/<int:id>/deals", methods=["POST"])
+@login_required
+@require_service('crm')
 def create_deal_route(id):
     Customer.query.get_or_404(id)
     data = request.get_json() or {}
@@ -140,6 +149,8 @@ def create_deal_route(id):
 # --- コンタクト履歴（Contact Logs） ---
 # GET /customers/<id>/contacts
 @crm_bp.route("/<int:id>/contacts", methods=["GET"])
+@login_required
+@require_service('crm')
 def list_contacts_route(id):
     Customer.query.get_or_404(id)
     logs = Contact.query.filter_by(customer_id=id).order_by(Contact.contact_date.desc()).all()
@@ -147,6 +158,8 @@ def list_contacts_route(id):
 
 # POST /customers/<id>/contacts
 @crm_bp.route("/<int:id>/contacts", methods=["POST"])
+@login_required
+@require_service('crm')
 def create_contact_route(id):
     Customer.query.get_or_404(id)
     data = request.get_json() or {}
@@ -0,0 +1,61 @@
+"""
+ヘッドレスのキャプチャワーカー（Electron プロセスの代替）
+
+supervisor から起動され、標準入力で受け取ったフレームを処理する。実際の Electron
+ワーカーも同じプロトコルを実装すれば CAPTURE_WORKER_COMMAND で差し替えられる。
+
+プロトコル:
+    supervisor -> worker（標準入力）: type (1 byte) | length (4 bytes, big endian) | payload
+        type 'C': 制御メッセージ（JSON）。cmd は assign / release / ping
+        type 'I': 暗号化された操作フレーム（cipher.py の形式）
+    worker -> supervisor（標準出力）: 1行1メッセージの JSON
+        起動完了時に {"status": "ready"}、ping に {"status": "pong", ...} を返す
+
+実行方法:
+    python -m feature.electronCapture.capture_worker
+"""
+import json
+import struct
+import sys
+
+HEADER = struct.Struct('>cI')
+
+
+def reply(message: dict):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    stdin = sys.stdin.buffer
+    session_id = None
+    interactions = 0
+
+    reply({'status': 'ready'})
+    while True:
+        header = stdin.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+        frame_type, length = HEADER.unpack(header)
+        payload = stdin.read(length)
+        if len(payload) < length:
+            break
+
+        if frame_type == b'I':
+            # 実際のワーカーではここで復号して操作を実行する
+            interactions += 1
+            continue
+
+        message = json.loads(payload)
+        cmd = message.get('cmd')
+        if cmd == 'assign':
+            session_id = message['config']['session_id']
+            interactions = 0
+        elif cmd == 'release':
+            session_id = None
+        elif cmd == 'ping':
+            reply({'status': 'pong', 'session_id': session_id, 'interactions': interactions})
+
+
+if __name__ == '__main__':
+    main()
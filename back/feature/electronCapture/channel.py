@@ -0,0 +1,150 @@
+"""
+キャプチャセッションごとの操作イベントチャネル
+
+1イベント1リクエストの /send-interaction の代わりに、チャネルを開く時に一度だけ
+トークンを検証し、以降はまとめて送られたイベントを受け付ける。
+- 連続するスクロールはデルタを合算し、連続するマウス移動は最後の位置だけを残す
+- セッションごとの有界キューに積み、共有ワーカープールがキャプチャプロセスへ転送する
+- キューが一杯の場合は受け付けを止め、クライアントに待機を促す（バックプレッシャー）
+"""
+import hmac
+import os
+import queue
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHANNEL_QUEUE_SIZE = int(os.environ.get('CAPTURE_CHANNEL_QUEUE_SIZE', '256'))
+CHANNEL_FORWARD_WORKERS = int(os.environ.get('CAPTURE_CHANNEL_FORWARD_WORKERS', '8'))
+# 1回の転送処理で送るイベント数の上限（他セッションを待たせないため）
+CHANNEL_DRAIN_BATCH = 64
+# 1バッチで受け付けるイベント数の上限
+MAX_EVENTS_PER_BATCH = 500
+
+_forward_executor = ThreadPoolExecutor(max_workers=CHANNEL_FORWARD_WORKERS, thread_name_prefix='capture-forward')
+
+
+def coalesce_events(events: list) -> list:
+    """
+    連続する同種のイベントをまとめる
+
+    - scroll: 同じ target への連続スクロールは deltaX / deltaY を合算
+    - mousemove: 同じ target への連続移動は最後のイベントのみ残す
+    それ以外（click, keypress, input など）は順序どおりそのまま残す。
+    """
+    merged = []
+    for event in events:
+        event_type = event.get('type')
+        last = merged[-1] if merged else None
+        if last is not None and last.get('type') == event_type and last.get('target') == event.get('target'):
+            if event_type == 'scroll':
+                last_data = last.setdefault('data', {}) or {}
+                data = event.get('data') or {}
+                last['data'] = {
+                    **last_data,
+                    'deltaX': (last_data.get('deltaX') or 0) + (data.get('deltaX') or 0),
+                    'deltaY': (last_data.get('deltaY') or 0) + (data.get('deltaY') or 0)
+                }
+                continue
+            if event_type == 'mousemove':
+                merged[-1] = dict(event)
+                continue
+        merged.append(dict(event))
+    return merged
+
+
+class InteractionChannel:
+    """セッション一つ分のチャネル（有界キューと転送状態）"""
+
+    def __init__(self, session_id: str, forward, queue_size: int = CHANNEL_QUEUE_SIZE):
+        self.session_id = session_id
+        self.channel_token = secrets.token_urlsafe(32)
+        self._forward = forward
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._draining = False
+        self.closed = False
+        self.stats = {'accepted': 0, 'forwarded': 0, 'failed': 0, 'rejected': 0}
+
+    def authenticate(self, channel_token: str) -> bool:
+        return hmac.compare_digest(self.channel_token, channel_token or '')
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def offer(self, events: list) -> int:
+        """イベントをキューに積み、受け付けた件数を返す（満杯になった時点で止める）"""
+        accepted = 0
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                break
+            accepted += 1
+        with self._lock:
+            self.stats['accepted'] += accepted
+            self.stats['rejected'] += len(events) - accepted
+            if accepted and not self._draining and not self.closed:
+                self._draining = True
+                _forward_executor.submit(self._drain)
+        return accepted
+
+    def close(self):
+        self.closed = True
+
+    def _drain(self):
+        while True:
+            sent = 0
+            while sent < CHANNEL_DRAIN_BATCH and not self.closed:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                ok = self._forward(self.session_id, event)
+                with self._lock:
+                    self.stats['forwarded' if ok else 'failed'] += 1
+                sent += 1
+
+            with self._lock:
+                if self.closed or self._queue.empty():
+                    self._draining = False
+                    return
+            if sent >= CHANNEL_DRAIN_BATCH:
+                # 他のセッションに順番を譲る
+                with self._lock:
+                    _forward_executor.submit(self._drain)
+                return
+
+
+class ChannelRegistry:
+    """このワーカーで開いているチャネルの管理"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def open(self, session_id: str, forward) -> InteractionChannel:
+        """チャネルを開く（既存のチャネルは閉じて作り直す）"""
+        channel = InteractionChannel(session_id, forward)
+        with self._lock:
+            previous = self._channels.get(session_id)
+            self._channels[session_id] = channel
+        if previous is not None:
+            previous.close()
+        return channel
+
+    def get(self, session_id: str):
+        return self._channels.get(session_id)
+
+    def close(self, session_id: str):
+        with self._lock:
+            channel = self._channels.pop(session_id, None)
+        if channel is not None:
+            channel.close()
+
+    def __len__(self):
+        return len(self._channels)
+
+
+channel_registry = ChannelRegistry()
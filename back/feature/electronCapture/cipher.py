@@ -0,0 +1,95 @@
+"""
+操作イベントの暗号化（AES-256-GCM）
+
+セッションごとの鍵は SECRET_KEY と session_id から HKDF-SHA256 で導出する。
+導出は決定的なので、どのワーカーでも同じ鍵になる（鍵を共有ストアに保存しない）。
+導出した AESGCM オブジェクトはセッション開始時に作成して使い回す。
+
+フレーム形式（バイナリ）:
+    version (1 byte) | nonce (12 bytes) | ciphertext + tag (16 bytes)
+平文は操作データの JSON（UTF-8）、追加認証データ（AAD）は session_id。
+"""
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+FRAME_VERSION = 1
+NONCE_SIZE = 12
+KEY_INFO = b'electron-capture-interaction-v1'
+CIPHER_CACHE_MAX_ENTRIES = int(os.environ.get('CAPTURE_CIPHER_CACHE_MAX_ENTRIES', '1000'))
+
+
+def derive_session_key(secret_key: str, session_id: str) -> bytes:
+    """セッション用の 256bit 鍵を導出"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=session_id.encode(),
+        info=KEY_INFO
+    ).derive(secret_key.encode())
+
+
+class SessionCipher:
+    """セッション一つ分の暗号化コンテキスト"""
+
+    __slots__ = ('session_id', 'key', '_aad', '_aesgcm')
+
+    def __init__(self, secret_key: str, session_id: str):
+        self.session_id = session_id
+        self.key = derive_session_key(secret_key, session_id)
+        self._aad = session_id.encode()
+        self._aesgcm = AESGCM(self.key)
+
+    def export_key(self) -> str:
+        """キャプチャプロセスに渡す鍵（base64）"""
+        return base64.b64encode(self.key).decode()
+
+    def encrypt(self, interaction: dict) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        plaintext = json.dumps(interaction, separators=(',', ':'), ensure_ascii=False).encode()
+        return bytes([FRAME_VERSION]) + nonce + self._aesgcm.encrypt(nonce, plaintext, self._aad)
+
+    def decrypt(self, frame: bytes) -> dict:
+        """フレームを復号（改ざん・形式不正の場合は ValueError）"""
+        if len(frame) < 1 + NONCE_SIZE + 16 or frame[0] != FRAME_VERSION:
+            raise ValueError('invalid interaction frame')
+        nonce = frame[1:1 + NONCE_SIZE]
+        try:
+            plaintext = self._aesgcm.decrypt(nonce, frame[1 + NONCE_SIZE:], self._aad)
+        except Exception as e:
+            raise ValueError('interaction frame authentication failed') from e
+        return json.loads(plaintext)
+
+
+class CipherRegistry:
+    """セッションごとの SessionCipher を保持（件数上限付き LRU、未登録のセッションは導出して登録）"""
+
+    def __init__(self, secret_key: str, max_entries: int = CIPHER_CACHE_MAX_ENTRIES):
+        self._secret_key = secret_key
+        self.max_entries = max_entries
+        self._ciphers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionCipher:
+        with self._lock:
+            cipher = self._ciphers.get(session_id)
+            if cipher is not None:
+                self._ciphers.move_to_end(session_id)
+                return cipher
+        # 鍵導出はロックの外で行う（同時に導出しても結果は同じ）
+        cipher = SessionCipher(self._secret_key, session_id)
+        with self._lock:
+            cipher = self._ciphers.setdefault(session_id, cipher)
+            while len(self._ciphers) > self.max_entries:
+                self._ciphers.popitem(last=False)
+        return cipher
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._ciphers.pop(session_id, None)
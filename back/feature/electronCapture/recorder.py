@@ -0,0 +1,235 @@
+"""
+キャプチャセッションの操作記録と再生
+
+セッションごとに追記専用のバイナリログを作成する。
+    ファイル先頭: MAGIC (4 bytes) | version (1 byte)
+    レコード:     length (4 bytes, big endian) | timestamp (8 bytes, UNIX 時刻の double) | payload
+payload は操作データの JSON（UTF-8）。最初のレコードはセッションのメタデータ
+（{'meta': {...}}）で、以降が操作イベント。
+
+レコードは O_APPEND で開いたファイルに 1 回の write で書き込むため、
+複数のワーカープロセスが同じセッションに書き込んでもレコードは混ざらない。
+読み込みは mmap で行い、ファイル全体をメモリに読み込まない。
+
+停止・失効したセッションのログは閉じるだけで残し、後から再生できるようにする。
+ログには利用者の操作内容が含まれるため無期限には残さず、最終更新から
+RECORDING_MAX_AGE 秒を過ぎたものを削除する。1 セッションのログは RECORDING_MAX_BYTES を
+超えたら以降の操作を記録しない。
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RECORDING_DIR = os.environ.get('CAPTURE_RECORDING_DIR', os.path.join(tempfile.gettempdir(), 'capture_recordings'))
+RECORDING_ENABLED = os.environ.get('CAPTURE_RECORDING_ENABLED', '1') == '1'
+RECORDING_MAX_BYTES = int(os.environ.get('CAPTURE_RECORDING_MAX_BYTES', str(16 * 1024 * 1024)))
+RECORDING_MAX_AGE = int(os.environ.get('CAPTURE_RECORDING_MAX_AGE', str(24 * 3600)))
+# 終了済みとして覚えておくセッション数の上限（遅れて届いた操作を捨てるため）
+CLOSED_SESSIONS_LIMIT = 10000
+
+MAGIC = b'CAPR'
+VERSION = 1
+FILE_HEADER = MAGIC + bytes([VERSION])
+RECORD_HEADER = struct.Struct('>Id')
+
+_SESSION_ID_PATTERN = re.compile(r'^[0-9A-Za-z-]{1,64}$')
+
+
+def recording_path(session_id: str, directory: str = RECORDING_DIR) -> str:
+    """セッションのログファイルのパス（session_id はパスに使える文字のみ許可）"""
+    if not _SESSION_ID_PATTERN.match(session_id or ''):
+        raise ValueError(f'invalid session_id: {session_id!r}')
+    return os.path.join(directory, f'{session_id}.caplog')
+
+
+def encode_record(payload: dict, timestamp: float = None) -> bytes:
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+    return RECORD_HEADER.pack(len(body), time.time() if timestamp is None else timestamp) + body
+
+
+class SessionRecorder:
+    """セッション一つ分の追記専用ログ"""
+
+    def __init__(self, path: str, meta: dict = None, create: bool = True, max_bytes: int = RECORDING_MAX_BYTES):
+        """create=False の場合、ログが存在しなければ FileNotFoundError（停止済みセッションのログを再作成しない）"""
+        self.path = path
+        self.max_bytes = max_bytes
+        flags = os.O_WRONLY | os.O_APPEND
+        if create:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            flags |= os.O_CREAT
+        self._fd = os.open(path, flags, 0o600)
+        self.size = os.fstat(self._fd).st_size
+        # 新規作成時のみファイルヘッダーとメタデータを書き込む
+        if self.size == 0:
+            self.size += os.write(self._fd, FILE_HEADER + encode_record({'meta': meta or {}}))
+
+    def append(self, interaction: dict, timestamp: float = None) -> bool:
+        """操作を追記（サイズ上限を超える場合は書き込まずに False）"""
+        record = encode_record(interaction, timestamp)
+        if self.size + len(record) > self.max_bytes:
+            return False
+        self.size += os.write(self._fd, record)
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class RecordingRegistry:
+    """このワーカーで書き込み中のログ（session_id -> SessionRecorder）"""
+
+    def __init__(self, directory: str = RECORDING_DIR, enabled: bool = RECORDING_ENABLED,
+                 max_bytes: int = RECORDING_MAX_BYTES, max_age: int = RECORDING_MAX_AGE):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._recorders = {}
+        self._closed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, meta: dict):
+        """セッション開始時にログを作成"""
+        if self.enabled:
+            with self._lock:
+                self._closed.pop(session_id, None)
+            self._get(session_id, meta, create=True)
+
+    def record(self, session_id: str, interaction: dict) -> bool:
+        """
+        操作を追記（別ワーカーで開始したセッションは既存のログに追記する）
+
+        停止済み・ログが削除済み・サイズ上限に達したセッションの操作は記録せず False を返す。
+        """
+        if not self.enabled:
+            return False
+        recorder = self._get(session_id)
+        return recorder is not None and recorder.append(interaction)
+
+    def close(self, session_id: str):
+        """ログを閉じ、以降に届いた操作は記録しない"""
+        with self._lock:
+            recorder = self._recorders.pop(session_id, None)
+            self._closed[session_id] = True
+            self._closed.move_to_end(session_id)
+            while len(self._closed) > CLOSED_SESSIONS_LIMIT:
+                self._closed.popitem(last=False)
+        if recorder is not None:
+            recorder.close()
+
+    def purge_expired(self) -> int:
+        """最終更新から max_age 秒を過ぎたログを削除し、削除した件数を返す"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        cutoff = time.time() - self.max_age
+        purged = 0
+        for entry in entries:
+            if not entry.name.endswith('.caplog'):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    self.close(entry.name[:-len('.caplog')])
+                    os.remove(entry.path)
+                    purged += 1
+            except FileNotFoundError:
+                pass
+        return purged
+
+    def path(self, session_id: str) -> str:
+        return recording_path(session_id, self.directory)
+
+    def _get(self, session_id: str, meta: dict = None, create: bool = False):
+        recorder = self._recorders.get(session_id)
+        if recorder is None:
+            with self._lock:
+                if session_id in self._closed:
+                    return None
+                recorder = self._recorders.get(session_id)
+                if recorder is None:
+                    try:
+                        recorder = SessionRecorder(self.path(session_id), meta, create=create, max_bytes=self.max_bytes)
+                    except FileNotFoundError:
+                        # 別ワーカーで停止・削除済みのセッション
+                        return None
+                    self._recorders[session_id] = recorder
+        return recorder
+
+
+def iter_records(path: str):
+    """ログを mmap で読み込み (timestamp, payload) を順に返す（メタデータを含む）"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(FILE_HEADER):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(FILE_HEADER)] != FILE_HEADER:
+                raise ValueError(f'{path} is not a capture recording')
+            offset = len(FILE_HEADER)
+            while offset + RECORD_HEADER.size <= size:
+                length, timestamp = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > size:
+                    # 書き込み途中のレコードは読まない
+                    break
+                yield timestamp, json.loads(data[start:start + length])
+                offset = start + length
+
+
+def read_meta(path: str) -> dict:
+    """先頭レコードのメタデータ"""
+    for _, payload in iter_records(path):
+        return payload.get('meta', {})
+    return {}
+
+
+def iter_interactions(path: str):
+    """メタデータを除いた (timestamp, interaction) を順に返す"""
+    records = iter_records(path)
+    next(records, None)
+    yield from records
+
+
+def summarize(path: str) -> dict:
+    """ログの件数・期間・サイズ"""
+    count = 0
+    first = last = None
+    for timestamp, _ in iter_interactions(path):
+        count += 1
+        first = timestamp if first is None else first
+        last = timestamp
+    return {
+        'meta': read_meta(path),
+        'interactions': count,
+        'duration': (last - first) if count else 0,
+        'size_bytes': os.path.getsize(path)
+    }
+
+
+def replay(path: str, speed: float = 1.0, sleep=time.sleep):
+    """
+    操作を記録時の間隔で順に返す（speed 倍速、0 以下なら待たずに返す）
+
+    各要素は {'offset': 最初の操作からの秒数, 'interaction': 操作データ}。
+    """
+    first = None
+    started = time.monotonic()
+    for timestamp, interaction in iter_interactions(path):
+        if first is None:
+            first = timestamp
+        offset = timestamp - first
+        if speed > 0:
+            delay = offset / speed - (time.monotonic() - started)
+            if delay > 0:
+                sleep(delay)
+        yield {'offset': round(offset, 6), 'interaction': interaction}
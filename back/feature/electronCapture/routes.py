@@ -1,64 +1,129 @@
-from flask import Blueprint, request, jsonify, session
-from flask_login import login_required, current_user
-import subprocess
+from flask import Blueprint, request, jsonify, Response
+from flask_login import current_user
 import json
 import os
-import base64
-from datetime import datetime, timedelta
+import socket
+import threading
+import time
+from datetime import datetime
 import uuid
-import hashlib
-import hmac
+from feature.sessionSync.store import create_session_store
+from .toolchain import toolchain_probe
+from .channel import channel_registry, coalesce_events, MAX_EVENTS_PER_BATCH
+from .tokens import TokenVerifier
+from .cipher import CipherRegistry
+from .supervisor import CaptureSupervisor, WorkerError
+from .recorder import RecordingRegistry, replay, summarize
+from .stats import SessionIndex
 
 electron_capture_bp = Blueprint('electron_capture', __name__, url_prefix='/api/service/3d')
 
 # セキュリティ設定
 SECRET_KEY = os.environ.get('ELECTRON_SECRET_KEY', 'dev-electron-secret')
 ALLOWED_ORIGINS = ['http://localhost:3000', 'https://yourdomain.com']
+token_verifier = TokenVerifier(SECRET_KEY)
+interaction_ciphers = CipherRegistry(SECRET_KEY)
 
 # アクティブなキャプチャセッション管理
-active_sessions = {}
+# SESSION_STORE_BACKEND=mysql / redis の場合は全ワーカーで共有される（値は JSON 化できるメタデータのみ）
+active_sessions = create_session_store('capture')
+# このワーカーが管理するキャプチャプロセスのプール（セッションへの割り当てもここで保持）
+capture_supervisor = CaptureSupervisor()
+# セッションごとの操作ログ（QA での再現・負荷試験用に再生できる）
+interaction_recordings = RecordingRegistry()
+# このワーカーで扱ったセッションの集計（session_id / user_id のインデックス）
+session_index = SessionIndex()
+
+# 操作がないまま経過すると失効するまでの秒数（操作のたびに延長）
+CAPTURE_SESSION_TTL = int(os.environ.get('CAPTURE_SESSION_TTL', '1800'))
+# ユーザーごとの同時セッション数の上限
+MAX_SESSIONS_PER_USER = int(os.environ.get('CAPTURE_MAX_SESSIONS_PER_USER', '5'))
+# 失効セッションを掃除する間隔（秒）
+CAPTURE_REAP_INTERVAL = int(os.environ.get('CAPTURE_REAP_INTERVAL', '60'))
+
+
+def get_worker_id() -> str:
+    """このワーカーの識別子（セッションアフィニティ用、fork 後の pid を使う）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def save_session(session_id: str, session_info: dict):
+    """セッション情報をレジストリに保存（TTL を延長）"""
+    session_info['last_seen'] = datetime.now().isoformat()
+    active_sessions.set(session_id, session_info, CAPTURE_SESSION_TTL, owner=str(session_info['user_id']))
+
+
+def record_interactions(session_id: str, session_info: dict, count: int = 1):
+    """操作数を集計し、書き戻し間隔を過ぎていればレジストリに反映（TTL も延長）"""
+    # 別のワーカーで開始したセッションはここで登録する
+    stats = session_index.get_or_add(session_id, session_info['user_id'], session_info['interactions_count'])
+    pending = stats.record(count)
+    if pending:
+        # 他のワーカーの書き戻し分を消さないよう、未反映の差分だけを加算する
+        session_info['interactions_count'] += pending
+        save_session(session_id, session_info)
+
+
+def current_interactions_count(session_id: str, session_info: dict) -> int:
+    """レジストリの操作数に、このワーカーで未反映の分を加えた値"""
+    stats = session_index.get(session_id)
+    return session_info['interactions_count'] + (stats.pending if stats else 0)
+
+
+def terminate_local_process(session_id: str):
+    """このワーカーが割り当てたキャプチャプロセスを解放（終了・再利用はスーパーバイザーが非同期に行う）"""
+    capture_supervisor.release(session_id)
+
+
+def reap_expired_sessions() -> int:
+    """失効・停止済みセッションのプロセスを終了し、終了した件数を返す"""
+    expired = set(active_sessions.sweep())
+    reaped = 0
+    for session_id in set(capture_supervisor.assigned_sessions()) | set(session_index.session_ids()):
+        if session_id in expired or active_sessions.get(session_id) is None:
+            session_index.remove(session_id)
+            channel_registry.close(session_id)
+            interaction_ciphers.discard(session_id)
+            interaction_recordings.close(session_id)
+            terminate_local_process(session_id)
+            reaped += 1
+    return reaped
+
+
+def _reaper_loop(app):
+    while True:
+        time.sleep(CAPTURE_REAP_INTERVAL)
+        try:
+            with app.app_context():
+                reap_expired_sessions()
+            interaction_recordings.purge_expired()
+        except Exception as e:
+            print(f"⚠️ Capture session reaper error: {e}")
+
+
+@electron_capture_bp.record_once
+def _start_session_reaper(state):
+    threading.Thread(target=_reaper_loop, args=(state.app,), name='capture-session-reaper', daemon=True).start()
+
+
+@electron_capture_bp.record_once
+def _start_capture_supervisor(state):
+    # 起動済みワーカーのプールをバックグラウンドで用意する
+    capture_supervisor.start()
+
+
+@electron_capture_bp.record_once
+def _warm_toolchain_probe(state):
+    # 起動時に Node.js / npm を確認しておき、セッション開始時にはプロセスを起動しない
+    toolchain_probe.refresh_async()
 
 def generate_secure_token(user_id: str, session_id: str) -> str:
     """セキュアなトークンを生成"""
-    timestamp = str(int(datetime.now().timestamp()))
-    message = f"{user_id}:{session_id}:{timestamp}"
-    signature = hmac.new(
-        SECRET_KEY.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    return base64.b64encode(f"{message}:{signature}".encode()).decode()
+    return token_verifier.generate(user_id, session_id)
 
 def verify_token(token: str) -> dict:
-    """トークンを検証"""
-    try:
-        decoded = base64.b64decode(token.encode()).decode()
-        parts = decoded.split(':')
-        if len(parts) != 4:
-            return None
-        
-        user_id, session_id, timestamp, signature = parts
-        message = f"{user_id}:{session_id}:{timestamp}"
-        expected_signature = hmac.new(
-            SECRET_KEY.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if signature != expected_signature:
-            return None
-        
-        # トークンの有効期限チェック（24時間）
-        if int(timestamp) < datetime.now().timestamp() - 86400:
-            return None
-        
-        return {
-            'user_id': user_id,
-            'session_id': session_id,
-            'timestamp': int(timestamp)
-        }
-    except Exception:
-        return None
+    """トークンを検証（検証済みトークンは有効期限までキャッシュされる）"""
+    return token_verifier.verify(token)
 
 @electron_capture_bp.route('/start-electron-capture', methods=['POST'])
 def start_electron_capture():
@@ -67,6 +132,13 @@ def start_electron_capture():
         user_id = getattr(current_user, 'id', 'test_user')
         data = request.get_json() or {}
         
+        # ユーザーごとの同時セッション数チェック
+        if active_sessions.count_by_owner(str(user_id)) >= MAX_SESSIONS_PER_USER:
+            return jsonify({
+                'success': False,
+                'error': f'同時に実行できるキャプチャは{MAX_SESSIONS_PER_USER}件までです'
+            }), 429
+        
         # セッションID生成
         session_id = str(uuid.uuid4())
         
@@ -88,29 +160,42 @@ def start_electron_capture():
             'token': secure_token
         }
         
+        session_index.add(session_id, user_id)
+        
+        # 操作ログを作成
+        interaction_recordings.start(session_id, {
+            'session_id': session_id,
+            'user_id': str(user_id),
+            'started_at': datetime.now().isoformat(),
+            'frame_rate': capture_config['frame_rate']
+        })
+        
         # Electronの可用性をチェック
         electron_available = check_electron_availability()
         
         if electron_available:
-            # 実際のElectronプロセスを起動
-            success, process_or_error = start_electron_process(capture_config)
+            # 実際のElectronプロセスを起動（操作の復号鍵はプロセスにのみ渡し、レジストリには保存しない）
+            cipher = interaction_ciphers.get(session_id)
+            success, process_or_error = start_electron_process({**capture_config, 'interaction_key': cipher.export_key()})
             
             if success:
-                # セッション情報を保存
-                active_sessions[session_id] = {
+                # プロセスはこのワーカーで保持し、共有レジストリにはメタデータのみ保存
+                save_session(session_id, {
+                    'process_pid': process_or_error.pid,
                     'user_id': user_id,
-                    'process': process_or_error,
+                    'worker_id': get_worker_id(),
                     'config': capture_config,
                     'started_at': datetime.now().isoformat(),
                     'status': 'running',
                     'streams': [],
                     'interactions_count': 0,
                     'mode': 'electron'
-                }
+                })
                 
                 return jsonify({
                     'success': True,
                     'session_id': session_id,
+                    'worker_id': get_worker_id(),
                     'token': secure_token,
                     'message': 'Electronキャプチャを開始しました',
                     'websocket_url': f'ws://localhost:8080/capture/{session_id}',
@@ -136,46 +221,24 @@ def start_electron_capture():
         }), 500
 
 def check_electron_availability() -> bool:
-    """Electronの可用性をチェック（Node.js環境の確認）"""
-    try:
-        # Node.jsの存在確認
-        result = subprocess.run(['node', '--version'], 
-                              capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
-            return False
-        
-        # npmの存在確認
-        npm_result = subprocess.run(['npm', '--version'], 
-                                  capture_output=True, text=True, timeout=5)
-        return npm_result.returncode == 0
-        
-    except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-        return False
+    """Electronの可用性をチェック（Node.js環境の確認結果はキャッシュを使う）"""
+    return toolchain_probe.get()['electron_available']
 
 def start_electron_process(capture_config: dict) -> tuple[bool, any]:
-    """Electronプロセスを起動（実際にはモックモードで動作）"""
+    """起動済みのキャプチャワーカーをプールから取り出してセッションに割り当てる"""
     try:
-        # 実際のElectronプロセス起動は複雑なため、現在はモックモードで動作
-        # 将来的には別のElectronアプリケーションとWebSocket通信で連携
-        
-        # モックプロセス情報を返す
-        mock_process = {
-            'pid': os.getpid(),
-            'status': 'mock_running',
-            'message': 'Electronプロセスの代わりにモックモードで動作中'
-        }
-        
-        return True, mock_process
+        worker = capture_supervisor.acquire(capture_config['session_id'], capture_config)
+        return True, worker
         
-    except Exception as e:
+    except (WorkerError, OSError) as e:
         return False, e
 
 def start_mock_capture(session_id: str, secure_token: str, capture_config: dict, reason: str) -> dict:
     """モックキャプチャセッションを開始"""
     # モックセッション情報を保存
-    active_sessions[session_id] = {
+    save_session(session_id, {
         'user_id': capture_config['user_id'],
-        'process': None,
+        'worker_id': get_worker_id(),
         'config': capture_config,
         'started_at': datetime.now().isoformat(),
         'status': 'mock_running',
@@ -186,11 +249,12 @@ def start_mock_capture(session_id: str, secure_token: str, capture_config: dict,
         ],
         'interactions_count': 0,
         'mode': 'mock'
-    }
+    })
     
     return jsonify({
         'success': True,
         'session_id': session_id,
+        'worker_id': get_worker_id(),
         'token': secure_token,
         'message': f'モックキャプチャを開始しました（理由: {reason}）',
         'websocket_url': f'ws://localhost:8080/capture/{session_id}',
@@ -222,11 +286,15 @@ def send_interaction():
         if not token_data or token_data['session_id'] != session_id:
             return jsonify({'success': False, 'error': '認証に失敗しました'}), 401
         
-        # セッション確認
-        if session_id not in active_sessions:
+        # セッション確認（共有レジストリから取得するため、どのワーカーでも処理できる）
+        session_info = active_sessions.get(session_id)
+        if session_info is None:
             return jsonify({'success': False, 'error': 'セッションが見つかりません'}), 404
         
-        session_info = active_sessions[session_id]
+        # キャプチャプロセスを保持していないワーカーでは送信できない
+        error = check_capture_owner(session_id, session_info)
+        if error:
+            return error
         
         # 操作イベント
         interaction = {
@@ -237,19 +305,23 @@ def send_interaction():
             'encrypted': True
         }
         
-        # 操作を暗号化（実際の実装では適切な暗号化を使用）
-        encrypted_interaction = encrypt_interaction(interaction, SECRET_KEY)
+        # 操作を記録し、暗号化（AES-256-GCM のバイナリフレーム）
+        interaction_recordings.record(session_id, interaction)
+        frame = encrypt_interaction(session_id, interaction)
         
         # Electronプロセスに送信（WebSocketまたはIPC経由）
-        success = send_to_electron_process(session_id, encrypted_interaction)
+        success = send_to_electron_process(session_id, frame, session_info.get('mode'))
         
         if success:
-            session_info['interactions_count'] += 1
-            return jsonify({
+            record_interactions(session_id, session_info)
+            response = jsonify({
                 'success': True,
                 'message': '操作を送信しました',
                 'interaction_id': str(uuid.uuid4())
             })
+            # ロードバランサーのセッションアフィニティ用
+            response.headers['X-Capture-Worker'] = session_info.get('worker_id', '')
+            return response
         else:
             return jsonify({
                 'success': False,
@@ -262,29 +334,175 @@ def send_interaction():
             'error': f'操作送信エラー: {str(e)}'
         }), 500
 
+# ==================== 操作イベントチャネル ====================
+
+# SSE で状態を通知する間隔（秒）
+CHANNEL_STATUS_INTERVAL = 1.0
+
+
+def build_interaction(event: dict) -> dict:
+    """受信したイベントから転送用の操作データを作成"""
+    return {
+        'type': event.get('type'),  # click, scroll, keypress, input, mousemove
+        'target': event.get('target'),  # CSS selector or coordinates
+        'data': event.get('data'),  # event-specific data
+        'timestamp': event.get('timestamp') or datetime.now().isoformat(),
+        'encrypted': True
+    }
+
+
+def forward_interaction(session_id: str, interaction: dict, mode: str = None) -> bool:
+    """チャネルの転送ワーカーから呼ばれ、記録・暗号化してキャプチャプロセスに送る"""
+    interaction_recordings.record(session_id, interaction)
+    return send_to_electron_process(session_id, encrypt_interaction(session_id, interaction), mode)
+
+
+@electron_capture_bp.route('/interaction-channel/<session_id>/open', methods=['POST'])
+def open_interaction_channel(session_id):
+    """操作イベントチャネルを開く（トークン検証はここで一度だけ行う）"""
+    try:
+        data = request.get_json() or {}
+        
+        token_data = verify_token(data.get('token'))
+        if not token_data or token_data['session_id'] != session_id:
+            return jsonify({'success': False, 'error': '認証に失敗しました'}), 401
+        
+        session_info = active_sessions.get(session_id)
+        if session_info is None:
+            return jsonify({'success': False, 'error': 'セッションが見つかりません'}), 404
+        
+        # チャネルはこのワーカーから転送するため、プロセスを保持するワーカーでのみ開く
+        error = check_capture_owner(session_id, session_info)
+        if error:
+            return error
+        
+        mode = session_info.get('mode')
+        channel = channel_registry.open(session_id, lambda sid, interaction: forward_interaction(sid, interaction, mode))
+        
+        response = jsonify({
+            'success': True,
+            'channel_token': channel.channel_token,
+            'events_url': f'/api/service/3d/interaction-channel/{session_id}/events',
+            'status_url': f'/api/service/3d/interaction-channel/{session_id}/status',
+            'max_events_per_batch': MAX_EVENTS_PER_BATCH
+        })
+        # チャネルはこのワーカーに保持されるため、以降のリクエストも同じワーカーに送る
+        response.headers['X-Capture-Worker'] = get_worker_id()
+        return response
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'チャネル作成エラー: {str(e)}'
+        }), 500
+
+
+def _get_authenticated_channel(session_id: str, channel_token: str):
+    channel = channel_registry.get(session_id)
+    if channel is None or channel.closed:
+        return None, (jsonify({'success': False, 'error': 'チャネルが見つかりません。再度 open してください'}), 409)
+    if not channel.authenticate(channel_token):
+        return None, (jsonify({'success': False, 'error': '認証に失敗しました'}), 401)
+    return channel, None
+
+
+@electron_capture_bp.route('/interaction-channel/<session_id>/events', methods=['POST'])
+def send_interaction_batch(session_id):
+    """
+    操作イベントをまとめて送信
+    
+    連続するスクロール・マウス移動はまとめてからキューに積む。キューが一杯になった
+    場合は受け付けた件数とともに 429 を返すので、クライアントは残りを再送する。
+    """
+    try:
+        data = request.get_json() or {}
+        channel, error = _get_authenticated_channel(session_id, data.get('channel_token'))
+        if error:
+            return error
+        
+        events = data.get('events') or []
+        if len(events) > MAX_EVENTS_PER_BATCH:
+            return jsonify({'success': False, 'error': f'1回に送信できるイベントは{MAX_EVENTS_PER_BATCH}件までです'}), 400
+        
+        interactions = [build_interaction(event) for event in coalesce_events(events)]
+        accepted = channel.offer(interactions)
+        
+        # 操作数はバッチ単位で一度だけ更新する
+        if accepted:
+            session_info = active_sessions.get(session_id)
+            if session_info is None:
+                channel_registry.close(session_id)
+                return jsonify({'success': False, 'error': 'セッションが見つかりません'}), 404
+            record_interactions(session_id, session_info, accepted)
+        
+        result = {
+            'success': accepted == len(interactions),
+            'received': len(events),
+            'coalesced': len(interactions),
+            'accepted': accepted,
+            'queue_depth': channel.queue_depth
+        }
+        if accepted < len(interactions):
+            # 受け付けられなかったイベント（末尾 len(interactions) - accepted 件）は再送が必要
+            result['error'] = '送信キューが一杯です'
+            response = jsonify(result)
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            return response
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'操作送信エラー: {str(e)}'
+        }), 500
+
+
+@electron_capture_bp.route('/interaction-channel/<session_id>/status', methods=['GET'])
+def stream_channel_status(session_id):
+    """チャネルのキュー状態を SSE で通知（クライアントの送信ペース調整用）"""
+    channel, error = _get_authenticated_channel(session_id, request.args.get('channel_token'))
+    if error:
+        return error
+    
+    def generate():
+        while not channel.closed:
+            payload = json.dumps({'queue_depth': channel.queue_depth, **channel.stats})
+            yield f"event: status\ndata: {payload}\n\n"
+            time.sleep(CHANNEL_STATUS_INTERVAL)
+        yield "event: closed\ndata: {}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @electron_capture_bp.route('/stop-capture/<session_id>', methods=['POST'])
 def stop_capture(session_id):
     """キャプチャを停止"""
     try:
-        if session_id not in active_sessions:
+        session_info = active_sessions.get(session_id)
+        if session_info is None:
             return jsonify({'success': False, 'error': 'セッションが見つかりません'}), 404
         
-        session_info = active_sessions[session_id]
-        
-        # Electronプロセスを終了
-        if session_info['process']:
-            session_info['process'].terminate()
-            session_info['process'].wait(timeout=5)
-        
         # セッション情報を削除
-        del active_sessions[session_id]
+        active_sessions.delete(session_id)
+        interactions_count = current_interactions_count(session_id, session_info)
+        session_index.remove(session_id)
+        
+        # Electronプロセスを終了（別ワーカーのプロセスはそのワーカーの掃除処理で終了する）
+        channel_registry.close(session_id)
+        token_verifier.invalidate_session(session_id)
+        interaction_ciphers.discard(session_id)
+        interaction_recordings.close(session_id)
+        terminate_local_process(session_id)
         
         return jsonify({
             'success': True,
             'message': 'キャプチャを停止しました',
             'session_stats': {
                 'duration': (datetime.now() - datetime.fromisoformat(session_info['started_at'])).total_seconds(),
-                'interactions_count': session_info['interactions_count']
+                'interactions_count': interactions_count
             }
         })
         
@@ -294,6 +512,81 @@ def stop_capture(session_id):
             'error': f'キャプチャ停止エラー: {str(e)}'
         }), 500
 
+# ==================== 操作ログの再生 ====================
+
+# 再生速度の上限（倍速）
+MAX_REPLAY_SPEED = 100.0
+
+
+def _get_recording_path(session_id: str):
+    """ログのパスを取得（存在しない・他ユーザーのログの場合はエラーレスポンスを返す）"""
+    try:
+        path = interaction_recordings.path(session_id)
+    except ValueError:
+        return None, (jsonify({'success': False, 'error': '不正なセッションIDです'}), 400)
+    if not os.path.exists(path):
+        return None, (jsonify({'success': False, 'error': '操作ログが見つかりません'}), 404)
+    return path, None
+
+
+@electron_capture_bp.route('/recordings/<session_id>', methods=['GET'])
+def get_recording(session_id):
+    """操作ログの概要（件数・期間・サイズ）を取得"""
+    try:
+        path, error = _get_recording_path(session_id)
+        if error:
+            return error
+        
+        summary = summarize(path)
+        if summary['meta'].get('user_id') != str(getattr(current_user, 'id', 'test_user')):
+            return jsonify({'success': False, 'error': '操作ログが見つかりません'}), 404
+        
+        return jsonify({'success': True, 'session_id': session_id, **summary})
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'操作ログ取得エラー: {str(e)}'
+        }), 500
+
+
+@electron_capture_bp.route('/recordings/<session_id>/replay', methods=['GET'])
+def replay_recording(session_id):
+    """
+    操作ログを記録時の間隔で NDJSON としてストリーミング
+    
+    Query params:
+        speed: 再生速度（1=等速、2=2倍速、0=待たずにすべて返す）
+    """
+    try:
+        path, error = _get_recording_path(session_id)
+        if error:
+            return error
+        
+        summary = summarize(path)
+        if summary['meta'].get('user_id') != str(getattr(current_user, 'id', 'test_user')):
+            return jsonify({'success': False, 'error': '操作ログが見つかりません'}), 404
+        
+        speed = float(request.args.get('speed', 1))
+        if speed < 0 or speed > MAX_REPLAY_SPEED:
+            return jsonify({'success': False, 'error': f'speed は 0〜{MAX_REPLAY_SPEED:g} で指定してください'}), 400
+        
+        def generate():
+            yield json.dumps({'type': 'meta', 'session_id': session_id, **summary}, ensure_ascii=False) + '\n'
+            for record in replay(path, speed):
+                yield json.dumps({'type': 'interaction', **record}, ensure_ascii=False) + '\n'
+            yield json.dumps({'type': 'done'}) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+        
+    except ValueError:
+        return jsonify({'success': False, 'error': 'speed は数値で指定してください'}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'操作ログ再生エラー: {str(e)}'
+        }), 500
+
 @electron_capture_bp.route('/sessions', methods=['GET'])
 def get_active_sessions():
     """アクティブなセッション一覧を取得"""
@@ -306,8 +599,10 @@ def get_active_sessions():
                 'started_at': info['started_at'],
                 'status': info['status'],
                 'streams_count': len(info['streams']),
-                'interactions_count': info['interactions_count'],
+                'interactions_count': current_interactions_count(session_id, info),
                 'mode': info.get('mode', 'unknown'),
+                'worker_id': info.get('worker_id'),
+                'last_seen': info.get('last_seen'),
                 'config': {
                     'quality': info['config']['quality'],
                     'frame_rate': info['config']['frame_rate'],
@@ -315,8 +610,7 @@ def get_active_sessions():
                     'interaction_enabled': info['config']['interaction_enabled']
                 }
             }
-            for session_id, info in active_sessions.items()
-            if info['user_id'] == user_id
+            for session_id, info in active_sessions.list_by_owner(str(user_id)).items()
         }
         
         return jsonify({
@@ -342,7 +636,10 @@ def test_endpoint():
             'message': 'Electron Capture API is working!',
             'timestamp': datetime.now().isoformat(),
             'electron_available': electron_available,
-            'active_sessions_count': len(active_sessions),
+            'active_sessions_count': active_sessions.count(),
+            'local_sessions_count': session_index.count(),
+            'capture_workers': capture_supervisor.stats(),
+            'worker_id': get_worker_id(),
             'system_info': {
                 'python_version': f"{os.sys.version_info.major}.{os.sys.version_info.minor}",
                 'platform': os.name
@@ -359,32 +656,15 @@ def test_endpoint():
 def check_electron():
     """Electronの状態をチェック"""
     try:
-        # Node.js環境の確認
-        node_available = False
-        node_version = None
-        npm_available = False
-        npm_version = None
-        
-        try:
-            node_result = subprocess.run(['node', '--version'], 
-                                       capture_output=True, text=True, timeout=5)
-            if node_result.returncode == 0:
-                node_available = True
-                node_version = node_result.stdout.strip()
-        except:
-            pass
-        
-        try:
-            npm_result = subprocess.run(['npm', '--version'], 
-                                      capture_output=True, text=True, timeout=5)
-            if npm_result.returncode == 0:
-                npm_available = True
-                npm_version = npm_result.stdout.strip()
-        except:
-            pass
+        # Node.js環境の確認（キャッシュ済みの結果を使う）
+        toolchain = toolchain_probe.get()
+        node_available = toolchain['node_available']
+        node_version = toolchain['node_version']
+        npm_available = toolchain['npm_available']
+        npm_version = toolchain['npm_version']
         
         # Electronの実行環境として必要な条件
-        electron_ready = node_available and npm_available
+        electron_ready = toolchain['electron_available']
         
         return jsonify({
             'success': True,
@@ -398,6 +678,7 @@ def check_electron():
                 'electron': 'npm install -g electron'
             },
             'alternative_mode': 'mock' if not electron_ready else None,
+            'checked_at': toolchain['checked_at'],
             'status_message': 'Electron実行環境が準備されています' if electron_ready else 'Node.js/npm環境が必要です'
         })
         
@@ -407,35 +688,55 @@ def check_electron():
             'error': f'環境チェックエラー: {str(e)}'
         }), 500
 
-def encrypt_interaction(interaction: dict, key: str) -> dict:
-    """操作データを暗号化（簡易実装）"""
-    # 実際の実装では、AESなどの適切な暗号化を使用
-    import json
-    data_str = json.dumps(interaction)
-    # 簡易的な暗号化（実際にはAES等を使用）
-    encrypted_data = base64.b64encode(data_str.encode()).decode()
-    
-    return {
-        'encrypted_data': encrypted_data,
-        'encryption_method': 'base64',  # 実際にはAES-256-GCM等
-        'timestamp': datetime.now().isoformat()
-    }
-
-def send_to_electron_process(session_id: str, interaction: dict) -> bool:
-    """Electronプロセスに操作を送信"""
+@electron_capture_bp.route('/check-electron/refresh', methods=['POST'])
+def refresh_electron_check():
+    """Electron実行環境の確認結果を破棄して再確認"""
     try:
-        # 実際の実装では、WebSocketやIPCを使用してElectronプロセスと通信
-        # ここでは模擬的な実装
-        session_info = active_sessions.get(session_id)
-        if not session_info:
-            return False
+        toolchain_probe.invalidate()
+        toolchain = toolchain_probe.get()
         
-        # WebSocket経由でElectronに送信（実装例）
-        # websocket_client.send(json.dumps(interaction))
+        return jsonify({
+            'success': True,
+            'message': '実行環境を再確認しました',
+            **toolchain
+        })
         
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'環境チェックエラー: {str(e)}'
+        }), 500
+
+def encrypt_interaction(session_id: str, interaction: dict) -> bytes:
+    """操作データを AES-256-GCM で暗号化したフレームを返す（形式は cipher.py を参照）"""
+    return interaction_ciphers.get(session_id).encrypt(interaction)
+
+def check_capture_owner(session_id: str, session_info: dict):
+    """
+    キャプチャプロセスを別のワーカーが保持している場合は 409 のエラーレスポンスを返す
+
+    プロセスはセッションを開始したワーカーにのみ存在するため、ロードバランサーは
+    X-Capture-Worker のワーカーにリクエストを送り直す。
+    """
+    if session_info.get('mode') == 'mock' or capture_supervisor.is_assigned(session_id):
+        return None
+    worker_id = session_info.get('worker_id', '')
+    response = jsonify({
+        'success': False,
+        'error': 'このセッションのキャプチャプロセスは別のワーカーで実行されています',
+        'worker_id': worker_id
+    })
+    response.headers['X-Capture-Worker'] = worker_id
+    return response, 409
+
+
+def send_to_electron_process(session_id: str, frame: bytes, mode: str = None) -> bool:
+    """キャプチャワーカーに操作フレームを送信（セッションの存在は呼び出し側で確認済み）"""
+    if mode == 'mock':
+        # ワーカーを割り当てていないモックセッションは送信済みとして扱う
         return True
-    except Exception:
-        return False
+    # 割り当てがない（停止済み・別ワーカーのセッション）場合は False
+    return capture_supervisor.send(session_id, frame)
 
 def create_electron_script(script_path: str):
     """Electronスクリプトを作成"""
@@ -546,10 +847,12 @@ function setupWebSocketServer() {
     wsServer.on('connection', (ws) => {
         console.log('Client connected');
         
-        ws.on('message', (message) => {
+        ws.on('message', (message, isBinary) => {
             try {
-                const data = JSON.parse(message);
-                handleInteraction(data);
+                if (!isBinary) {
+                    return;
+                }
+                handleInteraction(message);
             } catch (error) {
                 console.error('Message parsing error:', error);
             }
@@ -573,11 +876,19 @@ function handleInteraction(interaction) {
     executeInteraction(decryptedInteraction);
 }
 
-function decryptInteraction(encryptedInteraction) {
-    // 暗号化された操作を復号化
-    const { encrypted_data } = encryptedInteraction;
-    const decrypted = Buffer.from(encrypted_data, 'base64').toString();
-    return JSON.parse(decrypted);
+function decryptInteraction(frame) {
+    // version(1) | nonce(12) | ciphertext | tag(16) の AES-256-GCM フレームを復号化
+    if (frame[0] !== 1) {
+        throw new Error('Unsupported interaction frame version');
+    }
+    const key = Buffer.from(captureConfig.interaction_key, 'base64');
+    const nonce = frame.subarray(1, 13);
+    const tag = frame.subarray(frame.length - 16);
+    const decipher = crypto.createDecipheriv('aes-256-gcm', key, nonce);
+    decipher.setAAD(Buffer.from(captureConfig.session_id));
+    decipher.setAuthTag(tag);
+    const decrypted = Buffer.concat([decipher.update(frame.subarray(13, frame.length - 16)), decipher.final()]);
+    return JSON.parse(decrypted.toString('utf8'));
 }
 
 function executeInteraction(interaction) {
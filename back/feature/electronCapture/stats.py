@@ -0,0 +1,98 @@
+"""
+キャプチャセッションの集計（ワーカー内）
+
+操作数の更新は頻繁に呼ばれるため、このワーカーで扱っているセッションの集計を
+session_id から引けるインデックスに持ち、開始・停止時に更新しておく。
+ユーザーごとの一覧・件数は全ワーカー分が必要なため共有ストア側で数える。
+セッションごとの集計は __slots__ のクラスで持ち、操作のたびに共有レジストリへ
+書き戻さず、flush_interval 秒ごとにまとめて反映する。
+操作数の加算と書き戻す件数の取り出しはセッションごとのロックで行い、
+同時に届いた操作の取りこぼしや同じ差分の二重の書き戻しを防ぐ。
+"""
+import os
+import threading
+import time
+
+# 操作数を共有レジストリに書き戻す最短間隔（秒）
+CAPTURE_STATS_FLUSH_INTERVAL = float(os.environ.get('CAPTURE_STATS_FLUSH_INTERVAL', '5'))
+
+
+class CaptureSessionStats:
+    """セッション一つ分の集計"""
+
+    __slots__ = ('session_id', 'user_id', 'started_at', 'interactions', 'flushed_interactions',
+                 'last_interaction_at', 'last_flushed_at', '_lock')
+
+    def __init__(self, session_id: str, user_id: str, interactions: int = 0):
+        now = time.monotonic()
+        self.session_id = session_id
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.interactions = interactions
+        self.flushed_interactions = interactions
+        self.last_interaction_at = None
+        self.last_flushed_at = now
+        self._lock = threading.Lock()
+
+    def record(self, count: int = 1, interval: float = CAPTURE_STATS_FLUSH_INTERVAL) -> int:
+        """
+        操作数を加算し、書き戻し間隔を過ぎていれば未反映の操作数を取り出して返す（なければ 0）
+
+        取り出した件数は反映済みとして扱うため、呼び出し側はロックの外で書き戻す。
+        """
+        with self._lock:
+            self.interactions += count
+            self.last_interaction_at = time.time()
+            pending = self.interactions - self.flushed_interactions
+            now = time.monotonic()
+            if pending <= 0 or now - self.last_flushed_at < interval:
+                return 0
+            self.flushed_interactions = self.interactions
+            self.last_flushed_at = now
+            return pending
+
+    @property
+    def pending(self) -> int:
+        """まだレジストリに反映していない操作数"""
+        with self._lock:
+            return self.interactions - self.flushed_interactions
+
+
+class SessionIndex:
+    """session_id から集計を引くインデックス（件数の取得は O(1)）"""
+
+    def __init__(self):
+        self._sessions = {}  # session_id -> CaptureSessionStats
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, user_id, interactions: int = 0) -> CaptureSessionStats:
+        stats = CaptureSessionStats(session_id, str(user_id), interactions)
+        with self._lock:
+            self._sessions[session_id] = stats
+        return stats
+
+    def get(self, session_id: str):
+        return self._sessions.get(session_id)
+
+    def get_or_add(self, session_id: str, user_id, interactions: int = 0) -> CaptureSessionStats:
+        """登録済みならその集計を、なければ追加して返す（同時に呼ばれても一つにまとまる）"""
+        stats = self._sessions.get(session_id)
+        if stats is not None:
+            return stats
+        with self._lock:
+            stats = self._sessions.get(session_id)
+            if stats is None:
+                stats = CaptureSessionStats(session_id, str(user_id), interactions)
+                self._sessions[session_id] = stats
+        return stats
+
+    def remove(self, session_id: str):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def session_ids(self) -> list:
+        with self._lock:
+            return list(self._sessions)
+
+    def count(self) -> int:
+        return len(self._sessions)
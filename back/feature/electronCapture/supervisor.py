@@ -0,0 +1,297 @@
+"""
+キャプチャプロセスのスーパーバイザー
+
+起動済み（ready を返した）ワーカープロセスを一定数プールしておき、セッション開始時は
+プールから取り出すだけにする（プロセス起動をリクエストの処理時間に含めない）。
+- 保守スレッドがプールを pool_size まで補充し、待機中のワーカーを定期的に死活確認する
+- ワーカーは max_sessions 回セッションを担当したら破棄して作り直す
+- 終了処理（terminate / wait / kill）は専用スレッドで行い、リクエストを待たせない
+
+ワーカーとの通信プロトコルは capture_worker.py を参照。
+"""
+import json
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .capture_worker import HEADER
+
+CAPTURE_WORKER_POOL_SIZE = int(os.environ.get('CAPTURE_WORKER_POOL_SIZE', '2'))
+CAPTURE_WORKER_MAX_SESSIONS = int(os.environ.get('CAPTURE_WORKER_MAX_SESSIONS', '20'))
+CAPTURE_WORKER_HEALTH_INTERVAL = float(os.environ.get('CAPTURE_WORKER_HEALTH_INTERVAL', '10'))
+# ワーカーの起動完了・ping 応答を待つ秒数
+CAPTURE_WORKER_READY_TIMEOUT = float(os.environ.get('CAPTURE_WORKER_READY_TIMEOUT', '10'))
+# 終了要求後に強制終了するまでの秒数
+CAPTURE_WORKER_STOP_TIMEOUT = 5
+
+
+def default_worker_command() -> list:
+    """ワーカーの起動コマンド（CAPTURE_WORKER_COMMAND で Electron ワーカーに差し替え可能）"""
+    command = os.environ.get('CAPTURE_WORKER_COMMAND')
+    if command:
+        return shlex.split(command)
+    return [sys.executable, '-u', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capture_worker.py')]
+
+
+class WorkerError(Exception):
+    """ワーカーの起動・通信に失敗した"""
+
+
+class CaptureWorker:
+    """ワーカープロセス一つ分（標準出力は専用スレッドで読み取る）"""
+
+    def __init__(self, command: list):
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.sessions_served = 0
+        self.session_id = None
+        self.started_at = time.time()
+        self._write_lock = threading.Lock()
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read_replies, name=f'capture-worker-{self.pid}', daemon=True).start()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def wait_ready(self, timeout: float = CAPTURE_WORKER_READY_TIMEOUT):
+        self._expect('ready', timeout)
+
+    def ping(self, timeout: float = CAPTURE_WORKER_READY_TIMEOUT) -> dict:
+        self.control({'cmd': 'ping'})
+        return self._expect('pong', timeout)
+
+    def control(self, message: dict):
+        self._write(b'C', json.dumps(message).encode())
+
+    def send_interaction(self, frame: bytes):
+        self._write(b'I', frame)
+
+    def stop(self):
+        """終了させる（呼び出し元をブロックするので teardown スレッドから呼ぶ）"""
+        if self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.terminate()
+                self.process.wait(timeout=CAPTURE_WORKER_STOP_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+    def _write(self, frame_type: bytes, payload: bytes):
+        with self._write_lock:
+            try:
+                self.process.stdin.write(HEADER.pack(frame_type, len(payload)) + payload)
+                self.process.stdin.flush()
+            except (OSError, ValueError) as e:
+                raise WorkerError(f'ワーカー(pid={self.pid})への送信に失敗しました: {e}') from e
+
+    def _expect(self, status: str, timeout: float) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                message = self._replies.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise WorkerError(f'ワーカー(pid={self.pid})が {status} を返しませんでした')
+            if message is None:
+                raise WorkerError(f'ワーカー(pid={self.pid})が終了しました')
+            if message.get('status') == status:
+                return message
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            try:
+                self._replies.put(json.loads(line))
+            except ValueError:
+                continue
+        self._replies.put(None)
+
+
+class CaptureSupervisor:
+    """起動済みワーカーのプールとセッションへの割り当てを管理する"""
+
+    def __init__(self, command: list = None, pool_size: int = CAPTURE_WORKER_POOL_SIZE,
+                 max_sessions: int = CAPTURE_WORKER_MAX_SESSIONS,
+                 health_interval: float = CAPTURE_WORKER_HEALTH_INTERVAL):
+        self.command = command or default_worker_command()
+        self.pool_size = pool_size
+        self.max_sessions = max_sessions
+        self.health_interval = health_interval
+        self._idle = queue.Queue()
+        self._assigned = {}  # session_id -> CaptureWorker
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._teardown = ThreadPoolExecutor(max_workers=2, thread_name_prefix='capture-teardown')
+        self._thread = None
+        self._counters = {'spawned': 0, 'warm_starts': 0, 'cold_starts': 0, 'recycled': 0, 'unhealthy': 0}
+
+    def start(self):
+        """保守スレッドを起動（プールの補充はバックグラウンドで行う）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._maintain, name='capture-supervisor', daemon=True)
+                self._thread.start()
+
+    def acquire(self, session_id: str, config: dict) -> CaptureWorker:
+        """
+        ワーカーをセッションに割り当てる（プールが空の場合のみその場で起動する）
+
+        割り当ての送信に失敗したワーカーは破棄して次のワーカーで再試行する。
+        その場で起動したワーカーでも失敗した場合は WorkerError を送出する。
+        """
+        while True:
+            worker, cold = self._take_worker()
+            self._wakeup.set()
+            try:
+                worker.control({'cmd': 'assign', 'config': config})
+            except WorkerError:
+                # 死んだワーカーをプールに戻さず、補充は保守スレッドに任せる
+                self._count('unhealthy')
+                self._retire(worker)
+                if cold:
+                    raise
+                continue
+            break
+
+        self._count('cold_starts' if cold else 'warm_starts')
+        worker.session_id = session_id
+        with self._lock:
+            self._assigned[session_id] = worker
+        return worker
+
+    def release(self, session_id: str):
+        """セッションからワーカーを外す（ブロックしない）"""
+        with self._lock:
+            worker = self._assigned.pop(session_id, None)
+        if worker is None:
+            return
+        worker.session_id = None
+        worker.sessions_served += 1
+
+        if worker.sessions_served >= self.max_sessions or not worker.is_alive():
+            self._count('recycled')
+            self._retire(worker)
+            self._wakeup.set()
+            return
+        try:
+            worker.control({'cmd': 'release'})
+        except WorkerError:
+            self._retire(worker)
+            self._wakeup.set()
+            return
+        self._idle.put(worker)
+
+    def send(self, session_id: str, frame: bytes) -> bool:
+        """セッションのワーカーに操作フレームを送る"""
+        worker = self._assigned.get(session_id)
+        if worker is None:
+            return False
+        try:
+            worker.send_interaction(frame)
+            return True
+        except WorkerError:
+            return False
+
+    def is_assigned(self, session_id: str) -> bool:
+        return session_id in self._assigned
+
+    def assigned_sessions(self) -> list:
+        with self._lock:
+            return list(self._assigned)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            assigned = len(self._assigned)
+        return {**counters, 'idle': self._idle.qsize(), 'assigned': assigned, 'pool_size': self.pool_size}
+
+    def shutdown(self):
+        """全ワーカーを終了"""
+        with self._lock:
+            workers = list(self._assigned.values())
+            self._assigned.clear()
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            worker.stop()
+
+    # ---- 内部処理 ----
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _take_worker(self):
+        """待機中の生きているワーカーを取り出す（なければ起動する）。(ワーカー, その場で起動したか) を返す"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn(), True
+            if worker.is_alive():
+                return worker, False
+            self._count('unhealthy')
+            self._retire(worker)
+
+    def _spawn(self) -> CaptureWorker:
+        worker = CaptureWorker(self.command)
+        try:
+            worker.wait_ready()
+        except WorkerError:
+            self._retire(worker)
+            raise
+        self._count('spawned')
+        return worker
+
+    def _retire(self, worker: CaptureWorker):
+        self._teardown.submit(worker.stop)
+
+    def _check_idle(self):
+        """待機中のワーカーを ping し、応答しないものを破棄する"""
+        for _ in range(self._idle.qsize()):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if not worker.is_alive():
+                    raise WorkerError('exited')
+                worker.ping()
+            except WorkerError:
+                self._count('unhealthy')
+                self._retire(worker)
+                continue
+            self._idle.put(worker)
+
+    def _maintain(self):
+        while True:
+            try:
+                self._check_idle()
+                while self._idle.qsize() < self.pool_size:
+                    self._idle.put(self._spawn())
+                # 補充中に解放されたワーカーで上限を超えた分は終了させる
+                while self._idle.qsize() > self.pool_size:
+                    try:
+                        self._retire(self._idle.get_nowait())
+                    except queue.Empty:
+                        break
+            except Exception as e:
+                print(f"⚠️ Capture supervisor error: {e}")
+            self._wakeup.wait(timeout=self.health_interval)
+            self._wakeup.clear()
@@ -0,0 +1,105 @@
+"""
+キャプチャセッションのトークン生成・検証
+
+トークンは base64("user_id:session_id:timestamp:署名") で、署名は HMAC-SHA256。
+- 鍵を設定済みの HMAC オブジェクトを一度だけ作り、署名ごとに copy() して使う
+- 署名の比較は hmac.compare_digest で定数時間比較する
+- 検証済みトークンはダイジェストをキーにしてトークンの有効期限までキャッシュし、
+  操作イベントごとの base64 デコード・署名計算を省く
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# トークンの有効期間（秒）
+TOKEN_TTL = 24 * 60 * 60
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('CAPTURE_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+
+
+class TokenVerifier:
+    """鍵ごとのトークン署名・検証（検証結果キャッシュ付き、スレッドセーフ）"""
+
+    def __init__(self, secret_key: str, ttl: int = TOKEN_TTL, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._hmac = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+        self._cache = OrderedDict()  # sha256(token) -> (期限, 検証結果)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'rejected': 0}
+
+    def sign(self, message: str) -> str:
+        mac = self._hmac.copy()
+        mac.update(message.encode())
+        return mac.hexdigest()
+
+    def generate(self, user_id, session_id: str) -> str:
+        """トークンを生成"""
+        message = f"{user_id}:{session_id}:{int(time.time())}"
+        return base64.b64encode(f"{message}:{self.sign(message)}".encode()).decode()
+
+    def verify(self, token: str):
+        """トークンを検証し {'user_id', 'session_id', 'timestamp'} を返す（不正・期限切れは None）"""
+        if not token or not isinstance(token, str):
+            return None
+        now = time.time()
+        try:
+            digest = hashlib.sha256(token.encode()).digest()
+        except UnicodeError:
+            return None
+
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(digest)
+                    self.stats['hits'] += 1
+                    return dict(entry[1])
+                del self._cache[digest]
+            self.stats['misses'] += 1
+
+        result = self._decode(token, now)
+        if result is None:
+            with self._lock:
+                self.stats['rejected'] += 1
+            return None
+
+        with self._lock:
+            self._cache[digest] = (result['timestamp'] + self.ttl, result)
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return dict(result)
+
+    def invalidate_session(self, session_id: str):
+        """セッションに発行したトークンをキャッシュから削除"""
+        with self._lock:
+            for digest in [d for d, (_, r) in self._cache.items() if r['session_id'] == session_id]:
+                del self._cache[digest]
+
+    def _decode(self, token: str, now: float):
+        # 形式不正なトークンはすべて None（呼び出し側で 401）にする
+        try:
+            decoded = base64.b64decode(token.encode(), validate=True).decode()
+            parts = decoded.split(':')
+            if len(parts) != 4:
+                return None
+
+            user_id, session_id, timestamp, signature = parts
+            expected = self.sign(f"{user_id}:{session_id}:{timestamp}")
+            if not hmac.compare_digest(signature.encode(), expected.encode()):
+                return None
+            issued_at = int(timestamp)
+        except (ValueError, TypeError, UnicodeError):
+            return None
+        if issued_at < now - self.ttl:
+            return None
+
+        return {
+            'user_id': user_id,
+            'session_id': session_id,
+            'timestamp': issued_at
+        }
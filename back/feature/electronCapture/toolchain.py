@@ -0,0 +1,102 @@
+"""
+Electron 実行環境（Node.js / npm）の確認結果キャッシュ
+
+node --version / npm --version のプロセス起動はセッション開始ごとに行うと重いため、
+起動時に一度確認して結果を保持し、refresh_interval 秒を過ぎたらバックグラウンドで
+再確認する（再確認中は前回の結果を返す）。
+"""
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+PROBE_REFRESH_INTERVAL = int(os.environ.get('ELECTRON_PROBE_REFRESH_INTERVAL', '300'))
+PROBE_TIMEOUT = 5
+
+
+def _probe_command(command: str):
+    """コマンドの --version を実行し (利用可能か, バージョン) を返す"""
+    try:
+        result = subprocess.run([command, '--version'], capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+        if result.returncode == 0:
+            return True, result.stdout.strip()
+    except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError, OSError):
+        pass
+    return False, None
+
+
+def probe_toolchain() -> dict:
+    """Node.js / npm の状態を確認"""
+    node_available, node_version = _probe_command('node')
+    npm_available, npm_version = _probe_command('npm') if node_available else (False, None)
+    return {
+        'electron_available': node_available and npm_available,
+        'node_available': node_available,
+        'node_version': node_version,
+        'npm_available': npm_available,
+        'npm_version': npm_version,
+        'checked_at': datetime.now().isoformat()
+    }
+
+
+class ToolchainProbe:
+    """確認結果を保持し、期限切れ時はバックグラウンドで再確認する"""
+
+    def __init__(self, refresh_interval: int = PROBE_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()          # 結果の参照・差し替え用（確認中は保持しない）
+        self._probe_lock = threading.Lock()    # 確認処理を一つにまとめるためのロック
+        self._refreshing = False
+
+    def get(self) -> dict:
+        """確認結果を取得（未確認の場合のみ同期的に確認する）"""
+        with self._lock:
+            result = self._result
+            checked_at = self._checked_at
+        if result is None:
+            return self.refresh()
+        if time.monotonic() - checked_at >= self.refresh_interval:
+            self.refresh_async()
+        return result
+
+    def refresh(self) -> dict:
+        """同期的に再確認（同時に呼ばれた場合は一つの確認にまとめる）"""
+        requested_at = time.monotonic()
+        with self._probe_lock:
+            # 待っている間に他スレッドが確認を終えていれば、その結果を使う
+            with self._lock:
+                if self._result is not None and self._checked_at >= requested_at:
+                    return self._result
+            result = probe_toolchain()
+            with self._lock:
+                self._result = result
+                self._checked_at = time.monotonic()
+            return result
+
+    def refresh_async(self):
+        """バックグラウンドで再確認（実行中の場合は何もしない）"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='electron-toolchain-probe', daemon=True).start()
+
+    def invalidate(self):
+        """キャッシュを破棄（次回の get() で同期的に確認する）"""
+        with self._lock:
+            self._result = None
+            self._checked_at = 0.0
+
+
+toolchain_probe = ToolchainProbe()
@@ -0,0 +1,161 @@
+"""
+CSV からのユーザー一括作成
+
+CSV（ヘッダー行必須: username,password[,role]）を先頭から順に読み、CHUNK_SIZE 件ごとに
+- パスワードをプロセスプールで並列にハッシュ（bcrypt は CPU 律速のため）
+- users / user_roles / user_services を1つのトランザクションで登録
+する。既存ユーザー名・CSV 内の重複・不正な行はスキップして報告する。
+users.username の照合順序は大文字・小文字を区別しないため、重複判定も casefold して行う。
+"""
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from datetime import datetime
+
+from sqlalchemy import func
+
+from config.db import db
+from models.User import User
+from models.user_service import UserRole
+from feature.userService.entitlements import entitlement_cache
+from feature.userService.provisioning import DEFAULT_ROLE, DEFAULT_SERVICES_BY_ROLE, apply_entitlements
+from .security import BCRYPT_ROUNDS, hash_password
+
+CHUNK_SIZE = int(os.environ.get('BULK_USER_CHUNK_SIZE', '200'))
+HASH_PROCESSES = int(os.environ.get('BULK_USER_HASH_PROCESSES', str(os.cpu_count() or 2)))
+MAX_USERNAME_LENGTH = 150
+# bcrypt は先頭 72 バイトのみを使うため、それより長いパスワードは受け付けない
+MAX_PASSWORD_BYTES = 72
+# 結果に含めるスキップ行の上限
+MAX_REPORTED_ERRORS = 100
+
+_hash_pool = None
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # スレッドを多数持つ Flask プロセスを fork するとロックを握ったまま複製されうるため spawn を使う。
+        # spawn の子プロセスは起動スクリプト（app.py）を __mp_main__ として読み込み直すので、
+        # app.py ではアプリの作成を create_app() / __main__ ガードの内側に置いている。
+        # 子プロセスで実行するのは security.hash_password（bcrypt のみに依存）だけ。
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+    return _hash_pool
+
+
+def parse_rows(lines):
+    """CSV の各行を (行番号, username, password, role, エラー) で返す"""
+    reader = csv.DictReader(lines)
+    missing = {'username', 'password'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f'CSV のヘッダーに {", ".join(sorted(missing))} がありません')
+    for row in reader:
+        line = reader.line_num
+        username = (row.get('username') or '').strip()
+        password = row.get('password') or ''
+        role = (row.get('role') or '').strip() or DEFAULT_ROLE
+        error = None
+        if not username or len(username) > MAX_USERNAME_LENGTH:
+            error = f'username は1〜{MAX_USERNAME_LENGTH}文字で指定してください'
+        elif not password or len(password.encode('utf-8')) > MAX_PASSWORD_BYTES:
+            error = f'password は1〜{MAX_PASSWORD_BYTES}バイトで指定してください'
+        elif role not in DEFAULT_SERVICES_BY_ROLE:
+            error = f'不明なロールです: {role}'
+        yield line, username, password, role, error
+
+
+def _insert_chunk(rows: list) -> int:
+    """ハッシュ済みの (username, password_hash, role) を1トランザクションで登録"""
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': username, 'password_hash': password_hash} for username, password_hash, _ in rows
+    ])
+    roles = {username: role for username, _, role in rows}
+    ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(roles)).all())
+
+    db.session.execute(UserRole.__table__.insert(), [
+        {'user_id': ids[username], 'role': role, 'created_at': now} for username, role in roles.items()
+    ])
+    by_role = {}
+    for username, role in roles.items():
+        by_role.setdefault(role, []).append(ids[username])
+    for role, user_ids in by_role.items():
+        apply_entitlements(db.session, user_ids, list(DEFAULT_SERVICES_BY_ROLE[role]), True)
+    db.session.commit()
+    entitlement_cache.invalidate(*ids.values())
+    return len(rows)
+
+
+def provision_users(lines, chunk_size: int = CHUNK_SIZE):
+    """
+    CSV を読みながらユーザーを作成し、チャンクごとに進捗（dict）を返すジェネレーター
+
+    最後に type='summary' の集計（作成数・スキップ数・1秒あたりの作成数）を返す。
+    """
+    started = time.perf_counter()
+    created = 0
+    skipped = 0
+    errors = []
+    seen = set()
+    pool = get_hash_pool()
+
+    def skip(line, username, reason):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line, 'username': username, 'error': reason})
+
+    def flush(chunk):
+        nonlocal created
+        # 既存ユーザー名は1クエリでまとめて確認
+        existing = {row.username.casefold() for row in db.session.query(User.username).filter(
+            func.lower(User.username).in_([username.casefold() for _, username, _, _ in chunk]))}
+        chunk_rows = []
+        for line, username, password, role in chunk:
+            if username.casefold() in existing:
+                skip(line, username, '既に存在するユーザー名です')
+            else:
+                chunk_rows.append((username, password, role))
+        if not chunk_rows:
+            return
+        hashes = pool.map(hash_password, [password for _, password, _ in chunk_rows], repeat(BCRYPT_ROUNDS),
+                          chunksize=max(1, len(chunk_rows) // (HASH_PROCESSES * 4)))
+        try:
+            created += _insert_chunk([(u, h, r) for (u, _, r), h in zip(chunk_rows, hashes)])
+        except Exception as e:
+            db.session.rollback()
+            for username, _, _ in chunk_rows:
+                skip(None, username, f'登録に失敗しました: {e}')
+
+    chunk = []
+    for line, username, password, role, error in parse_rows(lines):
+        if error:
+            skip(line, username, error)
+            continue
+        if username.casefold() in seen:
+            skip(line, username, 'CSV 内でユーザー名が重複しています')
+            continue
+        seen.add(username.casefold())
+        chunk.append((line, username, password, role))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+            yield {'type': 'progress', 'created': created, 'skipped': skipped,
+                   'elapsed': round(time.perf_counter() - started, 3)}
+    if chunk:
+        flush(chunk)
+
+    elapsed = time.perf_counter() - started
+    yield {
+        'type': 'summary',
+        'created': created,
+        'skipped': skipped,
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'users_per_second': round(created / elapsed, 1) if elapsed > 0 else None,
+        'hash_processes': HASH_PROCESSES,
+        'bcrypt_rounds': BCRYPT_ROUNDS
+    }
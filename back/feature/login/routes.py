@@ -1,24 +1,150 @@
+import io
 import json
-from flask import Blueprint, request, jsonify
-from flask_login import login_user, login_required, logout_user, current_user
-import bcrypt
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_login import UserMixin, login_user, login_required, logout_user, current_user
 
 from models.User import User
 from config.db import db
+from feature.userService.entitlements import entitlement_cache, require_role
+from .bulk_users import provision_users
+from .security import PasswordHasherBusy, check_login_rate, password_hasher, username_limiter
 
 login_bp = Blueprint("login", __name__, url_prefix="/api/auth")
 
+# load_user の結果を保持する秒数と件数の上限
+IDENTITY_CACHE_TTL = float(os.environ.get("LOGIN_IDENTITY_CACHE_TTL", "30"))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get("LOGIN_IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+
+
+class CachedIdentity(UserMixin):
+    """
+    current_user として使うユーザーのスナップショット
+
+    ORM インスタンスはリクエスト（DB セッション）をまたいで使えないため、
+    認可に必要な値だけをコピーして保持する。パスワードハッシュは持たない。
+    """
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+        self.role_info = user.role_entry.to_dict() if user.role_entry else None
+
+
+class IdentityCache:
+    """user_id -> (期限, CachedIdentity) の TTL 付き LRU キャッシュ"""
+
+    def __init__(self, ttl: float = IDENTITY_CACHE_TTL, max_entries: int = IDENTITY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self._misses += 1
+        return None
+
+    def set(self, identity: CachedIdentity):
+        with self._lock:
+            self._entries[identity.id] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._invalidations += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "invalidations": self._invalidations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+
+identity_cache = IdentityCache()
+
+
+def invalidate_user(user_id: int):
+    """パスワード・ロールなどを変更したユーザーのキャッシュを破棄（次のリクエストで DB から読み直す）"""
+    identity_cache.invalidate(int(user_id))
+
+
 # Flask-Login 用: user_loader は app.py 側で login_manager に登録する
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    identity = identity_cache.get(user_id)
+    if identity is not None:
+        return identity
+
+    # role_entry は joined ロードのため、ユーザーとロールを1クエリで取得する
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    identity = CachedIdentity(user)
+    identity_cache.set(identity)
+    return identity
 
 @login_bp.route("/login", methods=["POST"])
 def login():
-    data = request.get_json()
-    user = User.query.filter_by(username=data["username"]).first()
-    if user and bcrypt.checkpw(data["password"].encode('utf-8'), user.password_hash.encode('utf-8')):
+    data = request.get_json() or {}
+    username = data.get("username") or ""
+    password = data.get("password") or ""
+
+    # 試行回数の制限（bcrypt の検証より前に判定する）
+    retry_after = check_login_rate(username, request.remote_addr or "unknown")
+    if retry_after:
+        response = jsonify({"message": "ログインの試行回数が多すぎます。しばらくしてから再度お試しください"})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(int(retry_after) + 1)
+        return response
+
+    user = User.query.filter_by(username=username).first()
+    try:
+        matched = password_hasher.verify(password, user.password_hash if user else None)
+    except PasswordHasherBusy as e:
+        response = jsonify({"message": str(e)})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+
+    if matched:
+        # BCRYPT_ROUNDS が変更されていれば、現在のコストでハッシュし直す
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.rehash(password)
+                db.session.commit()
+                invalidate_user(user.id)
+            except PasswordHasherBusy:
+                pass
+        username_limiter.reset(f"user:{username.lower()}")
         login_user(user)
-        return jsonify({"message": "ログイン成功"})
+        # 利用可能なサービスをログイン時に読み込んでおく（以降のページ表示ではキャッシュを使う）
+        entitlement_cache.get(user.id)
+        return jsonify({"message": "ログイン成功", "role": user.role})
     return jsonify({"message": "ユーザー名またはパスワードが違います"}), 401
 
 @login_bp.route("/logout", methods=["POST"])
@@ -32,5 +158,46 @@ def logout():
 def get_current_user():
     return jsonify({
         "id": current_user.id,
-        "username": current_user.username
-    })
\ No newline at end of file
+        "username": current_user.username,
+        "role": current_user.role,
+        "services": sorted(entitlement_cache.get(current_user.id))
+    })
+
+@login_bp.route("/identity-cache/metrics", methods=["GET"])
+@login_required
+@require_role("admin")
+def identity_cache_metrics():
+    """load_user のキャッシュのヒット率など（管理者専用）"""
+    return jsonify({"success": True, "metrics": identity_cache.metrics()})
+
+
+@login_bp.route("/login/metrics", methods=["GET"])
+@login_required
+@require_role("admin")
+def login_metrics():
+    """パスワード検証プールの状況（管理者専用）"""
+    return jsonify({"success": True, "metrics": password_hasher.metrics()})
+
+
+@login_bp.route("/users/bulk", methods=["POST"])
+@login_required
+@require_role("admin")
+def bulk_create_users():
+    """
+    CSV からユーザーを一括作成（管理者専用）
+
+    リクエスト本文は CSV（Content-Type: text/csv、ヘッダー行 username,password[,role]）。
+    本文を読みながら処理し、進捗と最後の集計を NDJSON でストリーミングする。
+    """
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+
+    def generate():
+        try:
+            for progress in provision_users(lines):
+                yield json.dumps(progress, ensure_ascii=False) + "\n"
+        except Exception as e:
+            db.session.rollback()
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no"})
@@ -0,0 +1,154 @@
+"""
+ログイン時のパスワード検証とレート制限
+
+- bcrypt の検証は専用の有界スレッドプールで行う（bcrypt は計算中に GIL を解放する）。
+  待ち行列が上限を超えた場合は PasswordHasherBusy を送出し、リクエストを受け付けない
+- ユーザー名・IP アドレスごとのトークンバケットで試行回数を制限する
+- 保存済みハッシュのコストが BCRYPT_ROUNDS と異なる場合は、ログイン成功時に再ハッシュする
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', '2'))
+# 検証待ちを含めて同時に受け付ける件数の上限
+LOGIN_HASH_MAX_PENDING = int(os.environ.get('LOGIN_HASH_MAX_PENDING', '32'))
+LOGIN_HASH_TIMEOUT = float(os.environ.get('LOGIN_HASH_TIMEOUT', '10'))
+
+# トークンバケット（容量・1秒あたりの補充量）
+LOGIN_RATE_USER_CAPACITY = float(os.environ.get('LOGIN_RATE_USER_CAPACITY', '5'))
+LOGIN_RATE_USER_REFILL = float(os.environ.get('LOGIN_RATE_USER_REFILL', str(5 / 60)))
+LOGIN_RATE_IP_CAPACITY = float(os.environ.get('LOGIN_RATE_IP_CAPACITY', '20'))
+LOGIN_RATE_IP_REFILL = float(os.environ.get('LOGIN_RATE_IP_REFILL', str(20 / 60)))
+LOGIN_RATE_MAX_KEYS = int(os.environ.get('LOGIN_RATE_MAX_KEYS', '100000'))
+
+
+class PasswordHasherBusy(Exception):
+    """検証待ちが上限に達している"""
+
+
+def hash_cost(password_hash: str):
+    """bcrypt ハッシュ（$2b$12$...）のコスト（解析できない場合は None）"""
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+class PasswordHasher:
+    """bcrypt の検証・ハッシュを有界のスレッドプールで行う"""
+
+    def __init__(self, workers: int = LOGIN_HASH_WORKERS, max_pending: int = LOGIN_HASH_MAX_PENDING,
+                 rounds: int = BCRYPT_ROUNDS, timeout: float = LOGIN_HASH_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login-bcrypt')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {'verified': 0, 'rejected_busy': 0, 'rehashed': 0}
+        # 存在しないユーザーでも同じ時間がかかるよう、ダミーのハッシュと照合する（初回に作成）
+        self._dummy_hash = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def verify(self, password: str, password_hash: str = None) -> bool:
+        """パスワードを検証（password_hash が None の場合はダミーと照合して False）"""
+        target = password_hash or self._get_dummy_hash()
+        matched = self._run(bcrypt.checkpw, password.encode('utf-8'), target.encode('utf-8'))
+        self._count('verified')
+        return matched and password_hash is not None
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return hash_cost(password_hash) != self.rounds
+
+    def rehash(self, password: str) -> str:
+        """現在のコストでハッシュし直す"""
+        new_hash = self._run(hash_password, password, self.rounds)
+        self._count('rehashed')
+        return new_hash
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'pending': self._pending, 'max_pending': self.max_pending, 'rounds': self.rounds}
+
+    def _get_dummy_hash(self) -> str:
+        if self._dummy_hash is None:
+            self._dummy_hash = self._run(hash_password, 'dummy-password', self.rounds)
+        return self._dummy_hash
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected_busy')
+            raise PasswordHasherBusy('ログイン処理が混み合っています')
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError as e:
+            raise PasswordHasherBusy('ログイン処理がタイムアウトしました') from e
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+
+class TokenBucketLimiter:
+    """キーごとのトークンバケット（キー数の上限付き、古いキーから破棄）"""
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = LOGIN_RATE_MAX_KEYS):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, tokens: float = 1.0) -> float:
+        """トークンを消費し、許可なら 0、拒否なら再試行までの秒数を返す"""
+        now = time.monotonic()
+        with self._lock:
+            available, updated_at = self._buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated_at) * self.refill_per_second)
+            if available >= tokens:
+                self._buckets[key] = (available - tokens, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (available, now)
+                retry_after = (tokens - available) / self.refill_per_second
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+password_hasher = PasswordHasher()
+username_limiter = TokenBucketLimiter(LOGIN_RATE_USER_CAPACITY, LOGIN_RATE_USER_REFILL)
+ip_limiter = TokenBucketLimiter(LOGIN_RATE_IP_CAPACITY, LOGIN_RATE_IP_REFILL)
+
+
+def check_login_rate(username: str, ip_address: str) -> float:
+    """ユーザー名・IP のレート制限を確認し、拒否なら再試行までの秒数を返す（許可なら 0）"""
+    retry_after = ip_limiter.consume(f'ip:{ip_address}')
+    if retry_after:
+        return retry_after
+    return username_limiter.consume(f'user:{username.lower()}')
@@ -0,0 +1,220 @@
+"""
+Webアプリ API へのプロキシクライアント
+
+- 上流ホストごとに keep-alive のコネクションプール（requests.Session）を共有する
+- ホストごとの同時実行数を BoundedSemaphore で制限する
+- 接続・読み込みタイムアウト、ジッター付き指数バックオフでのリトライ
+  （POST などの非冪等なリクエストは、上流に届いていないことが確実な場合のみリトライする）
+- (ユーザー, アプリ, エンドポイント) 単位の短い TTL の応答キャッシュ
+
+上流の URL・ヘッダー・模擬応答は registry のアダプターが持つ。
+URL は WEBAPP_PROXY_<APP>_BASE_URL（例: WEBAPP_PROXY_GITHUB_BASE_URL）で
+差し替えられるため、ローカルのスタブサーバーに向けて動作確認できる。
+"""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .registry import get_adapter
+
+PROXY_POOL_SIZE = int(os.environ.get('WEBAPP_PROXY_POOL_SIZE', '20'))
+PROXY_MAX_CONCURRENCY_PER_HOST = int(os.environ.get('WEBAPP_PROXY_MAX_CONCURRENCY', '10'))
+PROXY_CONNECT_TIMEOUT = float(os.environ.get('WEBAPP_PROXY_CONNECT_TIMEOUT', '3'))
+PROXY_READ_TIMEOUT = float(os.environ.get('WEBAPP_PROXY_READ_TIMEOUT', '10'))
+PROXY_MAX_RETRIES = int(os.environ.get('WEBAPP_PROXY_MAX_RETRIES', '2'))
+PROXY_BACKOFF_BASE = float(os.environ.get('WEBAPP_PROXY_BACKOFF_BASE', '0.2'))
+PROXY_BACKOFF_MAX = float(os.environ.get('WEBAPP_PROXY_BACKOFF_MAX', '2'))
+PROXY_CACHE_TTL = float(os.environ.get('WEBAPP_PROXY_CACHE_TTL', '15'))
+PROXY_CACHE_MAX_ENTRIES = int(os.environ.get('WEBAPP_PROXY_CACHE_MAX_ENTRIES', '1000'))
+
+# リトライ対象のステータスコード
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 非冪等なリクエストでもリトライするステータスコード（Retry-After がある場合のみ）
+RETRY_AFTER_STATUS = {429, 503}
+# 同じリクエストを再送しても結果が変わらないメソッド
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+
+class ProxyError(Exception):
+    """プロキシ処理のエラー（status はクライアントに返す HTTP ステータス）"""
+
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+class TTLCache:
+    """TTL 付き・件数上限付きの LRU キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """predicate(key) が真のエントリを削除"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+
+class UpstreamPool:
+    """上流ホストごとの Session とセマフォを保持する"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str):
+        """(Session, Semaphore) を取得（初回のみ生成）"""
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PROXY_POOL_SIZE, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._semaphores[host] = threading.BoundedSemaphore(PROXY_MAX_CONCURRENCY_PER_HOST)
+                    self._sessions[host] = session
+        return session, self._semaphores[host]
+
+
+upstream_pool = UpstreamPool()
+response_cache = TTLCache(PROXY_CACHE_TTL, PROXY_CACHE_MAX_ENTRIES)
+
+
+def _backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """フルジッター付き指数バックオフ（Retry-After があればそれを優先）"""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), PROXY_BACKOFF_MAX)
+    return random.uniform(0, min(PROXY_BACKOFF_MAX, PROXY_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _is_connect_error(error: Exception) -> bool:
+    """接続の確立前に失敗した（リクエストが上流に送られていない）か"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _request_with_retry(app_id: str, method: str, url: str, headers: dict, body=None, deadline: float = None):
+    host = urlsplit(url).netloc
+    session, semaphore = upstream_pool.acquire(host)
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+
+    last_error = None
+    for attempt in range(PROXY_MAX_RETRIES + 1):
+        read_timeout = PROXY_READ_TIMEOUT
+        if deadline is not None:
+            read_timeout = min(read_timeout, deadline - time.monotonic())
+            if read_timeout <= 0:
+                raise ProxyError(f'{app_id} の応答がタイムアウトしました', 504)
+
+        # ホストごとの同時実行数を制限（空きを待つのは接続タイムアウトまで）
+        if not semaphore.acquire(timeout=PROXY_CONNECT_TIMEOUT):
+            raise ProxyError(f'{app_id} への同時リクエスト数が上限に達しています', 503)
+        try:
+            response = session.request(
+                method, url,
+                headers=headers,
+                json=body,
+                timeout=(PROXY_CONNECT_TIMEOUT, read_timeout)
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            last_error = ProxyError(f'{app_id} への接続に失敗しました: {e}', 504)
+            retry_after = None
+            # 送信後のタイムアウト・切断では上流で処理済みの可能性があるため再送しない
+            if not idempotent and not _is_connect_error(e):
+                break
+        else:
+            retry_after = response.headers.get('Retry-After')
+            if response.status_code not in RETRYABLE_STATUS:
+                return response
+            if not idempotent and not (response.status_code in RETRY_AFTER_STATUS and retry_after):
+                return response
+            last_error = ProxyError(f'{app_id} がエラーを返しました（HTTP {response.status_code}）', 502)
+        finally:
+            semaphore.release()
+
+        if attempt < PROXY_MAX_RETRIES:
+            delay = _backoff_delay(attempt, retry_after)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+    raise last_error
+
+
+def fetch_app_data(user_id, app_id: str, access_token: str, endpoint: str = None,
+                   method: str = 'GET', body=None, deadline: float = None) -> dict:
+    """
+    Webアプリ API を呼び出して結果を返す
+
+    Returns:
+        {'data': 応答 JSON, 'upstream_status': ステータス, 'cached': キャッシュヒットか}
+    """
+    adapter = get_adapter(app_id)
+    if adapter is None:
+        raise ProxyError(f'Unsupported app: {app_id}', 400)
+
+    endpoint = endpoint or adapter.default_endpoint
+    if not endpoint.startswith('/') or '://' in endpoint:
+        raise ProxyError('endpoint は / から始まるパスで指定してください', 400)
+
+    method = method.upper()
+    cache_key = (str(user_id), app_id, endpoint)
+    if method == 'GET':
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'cached': True}
+
+    if access_token.startswith('mock_token_'):
+        # 模擬セッションでは上流を呼ばずに模擬データを返す
+        result = {'data': adapter.mock_response, 'upstream_status': 200}
+    else:
+        headers = adapter.build_headers(access_token)
+        response = _request_with_retry(app_id, method, adapter.get_base_url() + endpoint, headers, body, deadline)
+        if response.status_code >= 400:
+            raise ProxyError(f'{app_id} がエラーを返しました（HTTP {response.status_code}）', 502)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'raw': response.text}
+        result = {'data': data, 'upstream_status': response.status_code}
+
+    if method == 'GET':
+        response_cache.set(cache_key, result)
+    else:
+        # 書き込み系の呼び出し後は同じアプリのキャッシュを破棄
+        response_cache.invalidate(lambda key: key[0] == str(user_id) and key[1] == app_id)
+    return {**result, 'cached': False}
@@ -0,0 +1,202 @@
+"""
+同期済みセッションのトークン更新スケジューラー
+
+有効期限が近づいたセッションを、期限切れ前にバックグラウンドで更新する。
+- 更新予定は (更新時刻, user_id, app_id) の最小ヒープで管理し、専用スレッドが
+  先頭の時刻まで待機してから更新ワーカーに渡す
+- 同じ user_id / app_id への同時更新は一つの Future にまとめる
+- 更新に失敗したセッションは REFRESH_RETRY_DELAY 秒経つまで refresh_now() でも再試行しない
+- 更新の所要時間・成功/失敗件数を metrics() で取得できる
+"""
+import heapq
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from .proxy import upstream_pool
+from .registry import SESSION_TTL, get_adapter
+
+# 期限の何秒前に更新するか
+REFRESH_LEAD_TIME = int(os.environ.get('SESSION_REFRESH_LEAD_TIME', '600'))
+# 更新に失敗した場合の再試行間隔（秒）
+REFRESH_RETRY_DELAY = int(os.environ.get('SESSION_REFRESH_RETRY_DELAY', '60'))
+REFRESH_WORKERS = int(os.environ.get('SESSION_REFRESH_WORKERS', '4'))
+# レイテンシ統計に保持する直近の件数
+LATENCY_WINDOW = 1000
+
+
+def session_key(user_id, app_id: str) -> str:
+    return f"{user_id}_{app_id}"
+
+
+class TokenRefreshScheduler:
+    """期限前のトークン更新を行うバックグラウンドスケジューラー"""
+
+    def __init__(self, store, lead_time: int = REFRESH_LEAD_TIME, workers: int = REFRESH_WORKERS):
+        self.store = store
+        self.lead_time = lead_time
+        self._heap = []          # (refresh_at, user_id, app_id)
+        self._scheduled = {}     # (user_id, app_id) -> refresh_at（最新の予定のみ有効）
+        self._inflight = {}      # (user_id, app_id) -> Future
+        self._failures = {}      # (user_id, app_id) -> (失敗時刻, 失敗した Future)
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='session-refresh')
+        self._thread = None
+        self._app = None
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'scheduled': 0, 'refreshed': 0, 'failed': 0, 'coalesced': 0, 'skipped': 0, 'backoff': 0}
+
+    def start(self, app):
+        """スケジューラースレッドを起動（ストアのためにアプリコンテキストを保持する）"""
+        with self._condition:
+            self._app = app
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-refresh-scheduler', daemon=True)
+                self._thread.start()
+
+    def schedule(self, user_id, app_id: str, expires_at: float):
+        """期限 expires_at（UNIX 時刻）のセッションの更新を予約"""
+        refresh_at = max(expires_at - self.lead_time, time.time())
+        key = (str(user_id), app_id)
+        with self._condition:
+            self._scheduled[key] = refresh_at
+            heapq.heappush(self._heap, (refresh_at, key[0], app_id))
+            self._condition.notify()
+        self._count('scheduled')
+
+    def unschedule(self, user_id, app_id: str):
+        """予約を取り消す（ヒープ上の要素は取り出し時に読み捨てる）"""
+        with self._condition:
+            self._scheduled.pop((str(user_id), app_id), None)
+            self._failures.pop((str(user_id), app_id), None)
+
+    def refresh_now(self, user_id, app_id: str, force: bool = False) -> Future:
+        """
+        すぐに更新する（同じセッションの更新が実行中ならその Future を返す）
+
+        直近 REFRESH_RETRY_DELAY 秒以内に失敗したセッションは更新せず、失敗した Future を返す
+        （force=True の場合は待たずに更新する）。
+        Future の結果は更新後のセッション情報（セッションが存在しない場合は None）。
+        """
+        key = (str(user_id), app_id)
+        with self._condition:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count('coalesced')
+                return future
+            failure = self._failures.get(key)
+            if not force and failure is not None and time.monotonic() - failure[0] < REFRESH_RETRY_DELAY:
+                self._count('backoff')
+                return failure[1]
+            future = self._executor.submit(self._refresh, key[0], app_id)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._finish(key, future))
+        return future
+
+    def metrics(self) -> dict:
+        """更新処理の件数とレイテンシ（ミリ秒）の統計"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1)
+
+        with self._condition:
+            pending = len(self._scheduled)
+            inflight = len(self._inflight)
+            backing_off = len(self._failures)
+
+        return {
+            **counters,
+            'pending': pending,
+            'inflight': inflight,
+            'backing_off': backing_off,
+            'latency_ms': {
+                'samples': len(latencies),
+                'avg': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1] * 1000, 1) if latencies else None
+            }
+        }
+
+    # ---- 内部処理 ----
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _finish(self, key, future):
+        """実行中の Future を外し、失敗した場合は再試行を待たせるため失敗時刻を記録する"""
+        failed = not future.cancelled() and future.exception() is not None
+        with self._condition:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if failed:
+                self._failures[key] = (time.monotonic(), future)
+            else:
+                self._failures.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    refresh_at, user_id, app_id = self._heap[0]
+                    delay = refresh_at - time.time()
+                    if delay > 0:
+                        self._condition.wait(timeout=delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    key = (user_id, app_id)
+                    # 取り消し済み・再予約済みの要素は読み捨てる
+                    if self._scheduled.get(key) != refresh_at:
+                        continue
+                    del self._scheduled[key]
+                    break
+            # 予約どおりの再試行なので失敗後の待機中でも更新する
+            self.refresh_now(user_id, app_id, force=True)
+
+    def _refresh(self, user_id: str, app_id: str):
+        if self._app is None:
+            raise RuntimeError('TokenRefreshScheduler.start() が呼ばれていません')
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                key = session_key(user_id, app_id)
+                session_info = self.store.get(key)
+                adapter = get_adapter(app_id)
+                if session_info is None or adapter is None:
+                    # 無効化・失効済みのセッションは更新しない
+                    self._count('skipped')
+                    return None
+
+                http, _ = upstream_pool.acquire(urlsplit(adapter.token_url).netloc)
+                refreshed = adapter.refresh_session(session_info, http)
+                ttl = max(refreshed['expires_at'] - time.time(), 1)
+                self.store.set(key, refreshed, min(ttl, SESSION_TTL), owner=user_id)
+
+            self.schedule(user_id, app_id, refreshed['expires_at'])
+            with self._stats_lock:
+                self._latencies.append(time.perf_counter() - started)
+                self._counters['refreshed'] += 1
+            return refreshed
+        except Exception:
+            self._count('failed')
+            # 期限までに再試行できるよう短い間隔で再予約する
+            with self._condition:
+                retry_at = time.time() + REFRESH_RETRY_DELAY
+                self._scheduled[(user_id, app_id)] = retry_at
+                heapq.heappush(self._heap, (retry_at, user_id, app_id))
+                self._condition.notify()
+            raise
@@ -0,0 +1,195 @@
+"""
+セッション同期対象の Webアプリ（連携先）レジストリ
+
+連携先ごとに AppAdapter のサブクラスを定義し、INTEGRATIONS に登録する。
+レジストリはモジュール読み込み時に一度だけ構築・検証されるため、
+sync_session・プロキシ・トークン更新はリクエストごとに定義を作り直さない。
+
+新しい連携先を追加する場合は AppAdapter を継承したクラスを作り、
+_ADAPTER_CLASSES に追加する。
+"""
+import os
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+# 同期したセッションの有効期間（秒）
+SESSION_TTL = 24 * 60 * 60
+
+
+class AppAdapter:
+    """連携先 Webアプリのアダプター基底クラス"""
+
+    app_id = None
+    name = None
+    auth_url = None
+    token_url = None
+    scope = None
+    # プロキシ先 API
+    base_url = None
+    default_endpoint = None
+    extra_headers = {}
+    # 模擬トークン（mock_token_*）の場合に返す応答
+    mock_response = {}
+
+    REQUIRED_FIELDS = ('app_id', 'name', 'auth_url', 'token_url', 'scope', 'base_url', 'default_endpoint')
+
+    def validate(self):
+        """定義の妥当性を検証（不正な場合は ValueError）"""
+        for field in self.REQUIRED_FIELDS:
+            if not getattr(self, field):
+                raise ValueError(f'{type(self).__name__}.{field} is required')
+        for field in ('auth_url', 'token_url', 'base_url'):
+            if not getattr(self, field).startswith('https://'):
+                raise ValueError(f'{type(self).__name__}.{field} must be an https URL')
+        if not self.default_endpoint.startswith('/'):
+            raise ValueError(f'{type(self).__name__}.default_endpoint must start with /')
+
+    # ---- セッション同期 ----
+
+    def create_session(self, user_id, user_info: dict) -> dict:
+        """セッション情報を作成（実際の実装では OAuth2 フローで取得したトークンを使う）"""
+        now = datetime.now()
+        return {
+            'app_id': self.app_id,
+            'app_name': self.name,
+            'authenticated': True,
+            'synced_at': now.isoformat(),
+            'expires_at': (now + timedelta(seconds=SESSION_TTL)).timestamp(),
+            'access_token': f'mock_token_{self.app_id}_{user_id}',  # 実際の実装では暗号化して保存
+            'user_info': user_info
+        }
+
+    # ---- プロキシ ----
+
+    def get_base_url(self) -> str:
+        """プロキシ先のベース URL（WEBAPP_PROXY_<APP>_BASE_URL で上書き可能）"""
+        override = os.environ.get(f'WEBAPP_PROXY_{self.app_id.upper()}_BASE_URL')
+        return (override or self.base_url).rstrip('/')
+
+    def build_headers(self, access_token: str) -> dict:
+        """API 呼び出し用のヘッダー"""
+        return {'Authorization': f'Bearer {access_token}', **self.extra_headers}
+
+    # ---- トークン更新 ----
+
+    def is_mock_session(self, session_info: dict) -> bool:
+        return session_info.get('access_token', '').startswith('mock_token_')
+
+    def refresh_session(self, session_info: dict, http) -> dict:
+        """
+        アクセストークンを更新した新しいセッション情報を返す
+
+        http は requests.Session 互換のオブジェクト（プロキシと同じコネクションプールを使う）。
+        """
+        refreshed = dict(session_info)
+        now = datetime.now()
+
+        if not self.is_mock_session(session_info):
+            response = http.post(self.token_url, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': session_info.get('refresh_token'),
+                'client_id': os.environ.get(f'{self.app_id.upper()}_CLIENT_ID'),
+                'client_secret': os.environ.get(f'{self.app_id.upper()}_CLIENT_SECRET')
+            }, headers={'Accept': 'application/json'}, timeout=10)
+            response.raise_for_status()
+            token = response.json()
+            refreshed['access_token'] = token['access_token']
+            if token.get('refresh_token'):
+                refreshed['refresh_token'] = token['refresh_token']
+            ttl = int(token.get('expires_in', SESSION_TTL))
+        else:
+            ttl = SESSION_TTL
+
+        refreshed['synced_at'] = now.isoformat()
+        refreshed['expires_at'] = (now + timedelta(seconds=ttl)).timestamp()
+        return refreshed
+
+
+class GmailAdapter(AppAdapter):
+    app_id = 'gmail'
+    name = 'Gmail'
+    auth_url = 'https://accounts.google.com/oauth2/auth'
+    token_url = 'https://oauth2.googleapis.com/token'
+    scope = 'https://www.googleapis.com/auth/gmail.readonly'
+    base_url = 'https://gmail.googleapis.com'
+    default_endpoint = '/gmail/v1/users/me/messages?q=is:unread&maxResults=5'
+    mock_response = {
+        'unread_count': 5,
+        'recent_emails': [
+            {'subject': '重要なお知らせ', 'sender': 'info@example.com'},
+            {'subject': 'プロジェクト更新', 'sender': 'team@company.com'}
+        ]
+    }
+
+
+class GitHubAdapter(AppAdapter):
+    app_id = 'github'
+    name = 'GitHub'
+    auth_url = 'https://github.com/login/oauth/authorize'
+    token_url = 'https://github.com/login/oauth/access_token'
+    scope = 'user:email'
+    base_url = 'https://api.github.com'
+    default_endpoint = '/notifications'
+    extra_headers = {'Accept': 'application/vnd.github+json'}
+    mock_response = {
+        'notifications': 3,
+        'recent_repos': [
+            {'name': 'my-project', 'stars': 12},
+            {'name': 'another-repo', 'stars': 5}
+        ]
+    }
+
+
+class NotionAdapter(AppAdapter):
+    app_id = 'notion'
+    name = 'Notion'
+    auth_url = 'https://api.notion.com/v1/oauth/authorize'
+    token_url = 'https://api.notion.com/v1/oauth/token'
+    scope = 'read'
+    base_url = 'https://api.notion.com'
+    default_endpoint = '/v1/users/me'
+    extra_headers = {'Notion-Version': '2022-06-28'}
+    mock_response = {
+        'recent_pages': [
+            {'title': 'プロジェクト計画', 'updated': '2024-01-15'},
+            {'title': 'ミーティングノート', 'updated': '2024-01-14'}
+        ]
+    }
+
+
+class SlackAdapter(AppAdapter):
+    app_id = 'slack'
+    name = 'Slack'
+    auth_url = 'https://slack.com/oauth/v2/authorize'
+    token_url = 'https://slack.com/api/oauth.v2.access'
+    scope = 'users:read'
+    base_url = 'https://slack.com/api'
+    default_endpoint = '/conversations.list?limit=20'
+    mock_response = {
+        'unread_messages': 8,
+        'active_channels': ['general', 'development', 'random']
+    }
+
+
+_ADAPTER_CLASSES = (GmailAdapter, GitHubAdapter, NotionAdapter, SlackAdapter)
+
+
+def _build_registry(adapter_classes) -> MappingProxyType:
+    """アダプターを生成・検証してレジストリを構築（app_id の重複は不可）"""
+    registry = {}
+    for adapter_class in adapter_classes:
+        adapter = adapter_class()
+        adapter.validate()
+        if adapter.app_id in registry:
+            raise ValueError(f'Duplicate integration app_id: {adapter.app_id}')
+        registry[adapter.app_id] = adapter
+    return MappingProxyType(registry)
+
+
+# 読み込み時に一度だけ構築（不正な定義があれば起動時に失敗する）
+INTEGRATIONS = _build_registry(_ADAPTER_CLASSES)
+
+
+def get_adapter(app_id: str):
+    """app_id に対応するアダプター（未対応の場合は None）"""
+    return INTEGRATIONS.get(app_id)
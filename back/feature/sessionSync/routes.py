@@ -1,8 +1,14 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response
 from flask_login import login_required, current_user
-import requests
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
+from .store import create_session_store
+from .proxy import fetch_app_data, ProxyError
+from .registry import INTEGRATIONS, SESSION_TTL, get_adapter
+from .refresher import TokenRefreshScheduler, REFRESH_LEAD_TIME
 
 session_sync_bp = Blueprint('session_sync', __name__, url_prefix='/api')
 
@@ -18,9 +24,24 @@ def test_endpoint():
         'timestamp': datetime.now().isoformat()
     })
 
-# Webアプリのセッション情報を管理するための簡易ストレージ
-# 実際の実装では、データベースやRedisなどを使用
-webapp_sessions = {}
+# Webアプリのセッション情報を管理するストア
+# SESSION_STORE_BACKEND=mysql / redis で全ワーカー共有になる（デフォルトはプロセス内メモリ）
+webapp_sessions = create_session_store('webapp')
+
+# 期限前にトークンを更新するバックグラウンドスケジューラー（Blueprint 登録時に起動）
+refresh_scheduler = TokenRefreshScheduler(webapp_sessions)
+
+@session_sync_bp.record_once
+def _start_refresh_scheduler(state):
+    refresh_scheduler.start(state.app)
+
+# 複数アプリ一括取得（/webapp-proxy/batch）の設定
+BATCH_DEFAULT_DEADLINE = float(os.environ.get('WEBAPP_PROXY_BATCH_DEADLINE', '5'))
+BATCH_MAX_DEADLINE = 30.0
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('WEBAPP_PROXY_BATCH_WORKERS', '16')),
+    thread_name_prefix='webapp-proxy-batch'
+)
 
 @session_sync_bp.route('/sync-session/<app_id>', methods=['POST'])
 def sync_session(app_id):
@@ -31,42 +52,14 @@ def sync_session(app_id):
         # テスト用: 認証をバイパス（実際の実装では@login_requiredを使用）
         user_id = getattr(current_user, 'id', 'test_user')
         
-        # サポートされているWebアプリの定義
-        supported_apps = {
-            'gmail': {
-                'name': 'Gmail',
-                'auth_url': 'https://accounts.google.com/oauth2/auth',
-                'token_url': 'https://oauth2.googleapis.com/token',
-                'scope': 'https://www.googleapis.com/auth/gmail.readonly'
-            },
-            'github': {
-                'name': 'GitHub',
-                'auth_url': 'https://github.com/login/oauth/authorize',
-                'token_url': 'https://github.com/login/oauth/access_token',
-                'scope': 'user:email'
-            },
-            'notion': {
-                'name': 'Notion',
-                'auth_url': 'https://api.notion.com/v1/oauth/authorize',
-                'token_url': 'https://api.notion.com/v1/oauth/token',
-                'scope': 'read'
-            },
-            'slack': {
-                'name': 'Slack',
-                'auth_url': 'https://slack.com/oauth/v2/authorize',
-                'token_url': 'https://slack.com/api/oauth.v2.access',
-                'scope': 'users:read'
-            }
-        }
-        
-        if app_id not in supported_apps:
+        # 連携先の定義は registry に一度だけ構築済み
+        adapter = get_adapter(app_id)
+        if adapter is None:
             return jsonify({
                 'success': False,
                 'error': f'Unsupported app: {app_id}'
             }), 400
         
-        app_config = supported_apps[app_id]
-        
         # 既存のセッション情報をチェック
         session_key = f"{user_id}_{app_id}"
         existing_session = webapp_sessions.get(session_key)
@@ -75,10 +68,10 @@ def sync_session(app_id):
             # 有効なセッションが存在する場合
             return jsonify({
                 'success': True,
-                'message': f'{app_config["name"]}のセッションは既に同期されています',
+                'message': f'{adapter.name}のセッションは既に同期されています',
                 'session_info': {
                     'app_id': app_id,
-                    'app_name': app_config['name'],
+                    'app_name': adapter.name,
                     'authenticated': True,
                     'synced_at': existing_session.get('synced_at'),
                     'expires_at': existing_session.get('expires_at')
@@ -87,27 +80,18 @@ def sync_session(app_id):
         
         # 新しいセッション同期を実行（模擬的な処理）
         # 実際の実装では、OAuth2フローやAPIキー認証などを使用
-        
-        # 模擬的なセッション情報を作成
-        session_info = {
-            'app_id': app_id,
-            'app_name': app_config['name'],
-            'authenticated': True,
-            'synced_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=24)).timestamp(),
-            'access_token': f'mock_token_{app_id}_{user_id}',  # 実際の実装では暗号化して保存
-            'user_info': {
-                'email': getattr(current_user, 'email', 'test@example.com'),
-                'name': getattr(current_user, 'username', 'Test User')
-            }
-        }
+        session_info = adapter.create_session(user_id, {
+            'email': getattr(current_user, 'email', 'test@example.com'),
+            'name': getattr(current_user, 'username', 'Test User')
+        })
         
         # セッション情報を保存
-        webapp_sessions[session_key] = session_info
+        webapp_sessions.set(session_key, session_info, SESSION_TTL, owner=str(user_id))
+        refresh_scheduler.schedule(user_id, app_id, session_info['expires_at'])
         
         return jsonify({
             'success': True,
-            'message': f'{app_config["name"]}のセッション同期が完了しました',
+            'message': f'{adapter.name}のセッション同期が完了しました',
             'session_info': session_info
         })
         
@@ -127,6 +111,7 @@ def get_session_status(app_id):
         session_key = f"{user_id}_{app_id}"
         session_info = webapp_sessions.get(session_key)
         
+        # 期限切れのセッションはストア側で失効済み（None が返る）
         if not session_info:
             return jsonify({
                 'authenticated': False,
@@ -134,16 +119,6 @@ def get_session_status(app_id):
                 'message': 'セッション情報が見つかりません'
             })
         
-        # セッションの有効期限をチェック
-        if session_info.get('expires_at', 0) <= datetime.now().timestamp():
-            # 期限切れのセッションを削除
-            del webapp_sessions[session_key]
-            return jsonify({
-                'authenticated': False,
-                'app_id': app_id,
-                'message': 'セッションの有効期限が切れています'
-            })
-        
         return jsonify({
             'authenticated': True,
             'app_id': app_id,
@@ -168,8 +143,8 @@ def revoke_session(app_id):
         user_id = getattr(current_user, 'id', 'test_user')
         session_key = f"{user_id}_{app_id}"
         
-        if session_key in webapp_sessions:
-            del webapp_sessions[session_key]
+        refresh_scheduler.unschedule(user_id, app_id)
+        if webapp_sessions.delete(session_key):
             return jsonify({
                 'success': True,
                 'message': f'{app_id}のセッションを無効化しました'
@@ -186,6 +161,90 @@ def revoke_session(app_id):
             'error': f'セッション無効化中にエラーが発生しました: {str(e)}'
         }), 500
 
+@session_sync_bp.route('/webapp-proxy/batch', methods=['GET'])
+def webapp_proxy_batch():
+    """
+    複数Webアプリのデータを一括取得（NDJSON ストリーム）
+    
+    apps=gmail,github,slack で指定したアプリを並行して呼び出し、完了した順に
+    1行1アプリの JSON を返す。deadline（秒）までに応答しないアプリは
+    タイムアウトとして返し、最後に done 行を返す。
+    """
+    user_id = getattr(current_user, 'id', 'test_user')
+    app_ids = list(dict.fromkeys(
+        app_id.strip() for app_id in request.args.get('apps', '').split(',') if app_id.strip()
+    ))
+    if not app_ids:
+        return jsonify({'success': False, 'error': 'apps パラメータを指定してください'}), 400
+    
+    try:
+        deadline_seconds = min(float(request.args.get('deadline', BATCH_DEFAULT_DEADLINE)), BATCH_MAX_DEADLINE)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'deadline の形式が不正です'}), 400
+    
+    started = time.monotonic()
+    deadline = started + deadline_seconds
+    endpoint_overrides = {app_id: request.args.get(f'{app_id}_endpoint') for app_id in app_ids}
+    
+    # セッションはリクエストスレッドで読み込んでおく（ストアがアプリコンテキストを必要とするため）
+    immediate = []
+    futures = {}
+    for app_id in app_ids:
+        if app_id not in INTEGRATIONS:
+            immediate.append({'app_id': app_id, 'success': False, 'status': 400, 'error': f'Unsupported app: {app_id}'})
+            continue
+        session_info = webapp_sessions.get(f"{user_id}_{app_id}")
+        if not session_info or session_info.get('expires_at', 0) <= datetime.now().timestamp():
+            immediate.append({'app_id': app_id, 'success': False, 'status': 401, 'error': '認証が必要です'})
+            continue
+        future = batch_executor.submit(
+            fetch_app_data,
+            user_id,
+            app_id,
+            session_info.get('access_token', ''),
+            endpoint=endpoint_overrides[app_id],
+            deadline=deadline
+        )
+        futures[future] = app_id
+    
+    def line(payload: dict) -> str:
+        payload['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return json.dumps(payload, ensure_ascii=False) + '\n'
+    
+    def generate():
+        for payload in immediate:
+            yield line(payload)
+        
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=max(deadline - time.monotonic(), 0)):
+                pending.discard(future)
+                app_id = futures[future]
+                try:
+                    result = future.result()
+                    yield line({
+                        'app_id': app_id,
+                        'success': True,
+                        'status': 200,
+                        'data': result['data'],
+                        'cached': result['cached']
+                    })
+                except ProxyError as e:
+                    yield line({'app_id': app_id, 'success': False, 'status': e.status, 'error': str(e)})
+                except Exception as e:
+                    yield line({'app_id': app_id, 'success': False, 'status': 500, 'error': str(e)})
+        except FuturesTimeoutError:
+            for future in pending:
+                future.cancel()
+                yield line({'app_id': futures[future], 'success': False, 'status': 504, 'error': '期限内に応答がありませんでした'})
+        
+        yield line({'done': True, 'apps_count': len(app_ids)})
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @session_sync_bp.route('/webapp-proxy/<app_id>', methods=['GET', 'POST'])
 def webapp_proxy(app_id):
     """
@@ -202,48 +261,51 @@ def webapp_proxy(app_id):
                 'error': '認証が必要です'
             }), 401
         
-        # 実際の実装では、各Webアプリの API に対してプロキシリクエストを送信
-        # ここでは模擬的なレスポンスを返す
-        
-        mock_responses = {
-            'gmail': {
-                'unread_count': 5,
-                'recent_emails': [
-                    {'subject': '重要なお知らせ', 'sender': 'info@example.com'},
-                    {'subject': 'プロジェクト更新', 'sender': 'team@company.com'}
-                ]
-            },
-            'github': {
-                'notifications': 3,
-                'recent_repos': [
-                    {'name': 'my-project', 'stars': 12},
-                    {'name': 'another-repo', 'stars': 5}
-                ]
-            },
-            'notion': {
-                'recent_pages': [
-                    {'title': 'プロジェクト計画', 'updated': '2024-01-15'},
-                    {'title': 'ミーティングノート', 'updated': '2024-01-14'}
-                ]
-            },
-            'slack': {
-                'unread_messages': 8,
-                'active_channels': ['general', 'development', 'random']
-            }
-        }
+        # 予約した更新より先に期限が近づいている場合（他ワーカーで同期された等）は
+        # バックグラウンドで更新しておき、このリクエストは現在のトークンで処理する
+        if session_info['expires_at'] - datetime.now().timestamp() < REFRESH_LEAD_TIME:
+            refresh_scheduler.refresh_now(user_id, app_id)
+        
+        # 共有コネクションプール経由で Webアプリの API を呼び出す
+        # （模擬トークンの場合は模擬データ、GET は短時間キャッシュされる）
+        result = fetch_app_data(
+            user_id,
+            app_id,
+            session_info.get('access_token', ''),
+            endpoint=request.args.get('endpoint'),
+            method=request.method,
+            body=request.get_json(silent=True) if request.method == 'POST' else None
+        )
         
         return jsonify({
             'success': True,
             'app_id': app_id,
-            'data': mock_responses.get(app_id, {}),
+            'data': result['data'],
+            'upstream_status': result['upstream_status'],
+            'cached': result['cached'],
             'session_info': {
                 'authenticated': True,
                 'user_info': session_info.get('user_info')
             }
         })
         
+    except ProxyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
     except Exception as e:
         return jsonify({
             'success': False,
             'error': f'プロキシリクエスト中にエラーが発生しました: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@session_sync_bp.route('/session-refresh/metrics', methods=['GET'])
+def get_refresh_metrics():
+    """
+    トークン更新スケジューラーの統計（件数・レイテンシ）を取得
+    """
+    return jsonify({
+        'success': True,
+        'metrics': refresh_scheduler.metrics()
+    })
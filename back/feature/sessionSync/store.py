@@ -0,0 +1,401 @@
+"""
+有効期限付きセッションストア
+
+SESSION_STORE_BACKEND 環境変数で実装を切り替える:
+    memory: プロセス内メモリ（開発用）。期限は最小ヒープで管理し、件数上限あり
+    mysql:  shared_sessions テーブル（本番用、gunicorn の全ワーカーで共有）
+    redis:  Redis 互換ストア（REDIS_URL）。期限はストア側の TTL に任せ、件数は期限の
+            ソート済みセットで数える
+
+値は JSON 化できる dict のみを扱う。取得した dict を書き換えても
+ストアには反映されないため、更新時は必ず set() し直すこと。
+"""
+import copy
+import heapq
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+SESSION_STORE_BACKEND = os.environ.get('SESSION_STORE_BACKEND', 'memory')
+SESSION_STORE_MAX_ENTRIES = int(os.environ.get('SESSION_STORE_MAX_ENTRIES', '10000'))
+# 書き込み時に一度に掃除する期限切れエントリの上限
+SWEEP_BATCH_SIZE = 500
+# 共有ストアで書き込み時に掃除を行う最短間隔（秒）
+SWEEP_INTERVAL = int(os.environ.get('SESSION_STORE_SWEEP_INTERVAL', '60'))
+
+
+class SessionStore(ABC):
+    """セッションストアの共通インターフェース（未実装のメソッドがある実装はインスタンス化できない）"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    @abstractmethod
+    def get(self, key: str):
+        """有効なセッションを取得（存在しない・期限切れの場合は None）"""
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl: float, owner: str = None):
+        """セッションを保存（ttl 秒後に失効）"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """セッションを削除（削除できた場合は True）"""
+
+    @abstractmethod
+    def sweep(self, limit: int = SWEEP_BATCH_SIZE) -> list:
+        """期限切れのセッションを削除し、削除したキーを返す"""
+
+    @abstractmethod
+    def list_by_owner(self, owner: str) -> dict:
+        """owner が所有する有効なセッションを {key: value} で取得"""
+
+    @abstractmethod
+    def count_by_owner(self, owner: str) -> int:
+        """owner が所有する有効なセッション数（値を読み込まずに数える）"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """有効なセッション数"""
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    プロセス内メモリのストア
+
+    期限は (expires_at, key) の最小ヒープで管理するため、掃除は期限切れ1件あたり O(log n)。
+    再設定で古くなったヒープ要素は取り出し時に読み捨てる。
+    """
+
+    def __init__(self, namespace: str, max_entries: int = SESSION_STORE_MAX_ENTRIES):
+        super().__init__(namespace)
+        self.max_entries = max_entries
+        self._entries = {}   # key -> (expires_at, value, owner)
+        self._heap = []      # (expires_at, key)
+        self._owners = {}    # owner -> set(key)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(key)
+                return None
+            return copy.deepcopy(entry[1])
+
+    def set(self, key: str, value: dict, ttl: float, owner: str = None):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._sweep_locked(SWEEP_BATCH_SIZE)
+            if key not in self._entries:
+                # 上限に達している場合は最も早く失効するエントリから追い出す
+                while len(self._entries) >= self.max_entries and self._heap:
+                    self._evict_soonest()
+            elif self._entries[key][2] != owner:
+                self._unindex_owner(key, self._entries[key][2])
+            self._entries[key] = (expires_at, copy.deepcopy(value), owner)
+            if owner is not None:
+                self._owners.setdefault(owner, set()).add(key)
+            heapq.heappush(self._heap, (expires_at, key))
+            self._compact_heap()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def sweep(self, limit: int = SWEEP_BATCH_SIZE) -> list:
+        with self._lock:
+            return self._sweep_locked(limit)
+
+    def list_by_owner(self, owner: str) -> dict:
+        with self._lock:
+            now = time.time()
+            return {
+                key: copy.deepcopy(self._entries[key][1])
+                for key in self._owners.get(owner, ())
+                if self._entries[key][0] > now
+            }
+
+    def count_by_owner(self, owner: str) -> int:
+        # 期限切れを先に掃除してから所有者インデックスの件数を返す（O(1) + 掃除分）
+        with self._lock:
+            self._sweep_locked(SWEEP_BATCH_SIZE)
+            return len(self._owners.get(owner, ()))
+
+    def count(self) -> int:
+        # 期限切れで未掃除のエントリも含む概数（O(1)）
+        return len(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---- 内部処理（ロック取得済みで呼ぶ） ----
+
+    def _remove(self, key: str):
+        _, _, owner = self._entries.pop(key)
+        self._unindex_owner(key, owner)
+
+    def _unindex_owner(self, key: str, owner):
+        keys = self._owners.get(owner)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._owners[owner]
+
+    def _is_current(self, expires_at: float, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == expires_at
+
+    def _sweep_locked(self, limit: int) -> list:
+        now = time.time()
+        removed = []
+        while self._heap and self._heap[0][0] <= now and len(removed) < limit:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._is_current(expires_at, key):
+                self._remove(key)
+                removed.append(key)
+        return removed
+
+    def _evict_soonest(self):
+        while self._heap:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._is_current(expires_at, key):
+                self._remove(key)
+                return
+
+    def _compact_heap(self):
+        # 古い要素が溜まりすぎたらヒープを作り直してメモリを抑える
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(entry[0], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+
+
+class MySQLSessionStore(SessionStore):
+    """
+    shared_sessions テーブルを使うストア
+
+    ORM のセッションとは別のコネクション・トランザクションで読み書きするため、
+    呼び出し側のリクエスト処理のトランザクションには影響しない。
+    期限切れの掃除は (namespace, expires_at) インデックスの範囲削除で行い、
+    書き込み時に SWEEP_INTERVAL 秒に一度だけ実行する。
+    """
+
+    def __init__(self, namespace: str):
+        super().__init__(namespace)
+        self._last_sweep = 0.0
+
+    def _engine(self):
+        from config.db import db
+        return db.engine
+
+    def _table(self):
+        from models.shared_session import SharedSession
+        return SharedSession.__table__
+
+    def get(self, key: str):
+        table = self._table()
+        with self._engine().connect() as conn:
+            row = conn.execute(
+                table.select().where(
+                    table.c.namespace == self.namespace,
+                    table.c.session_key == key,
+                    table.c.expires_at > datetime.utcnow()
+                )
+            ).first()
+        return json.loads(row.payload) if row else None
+
+    def set(self, key: str, value: dict, ttl: float, owner: str = None):
+        from sqlalchemy.dialects.mysql import insert
+        table = self._table()
+        now = datetime.utcnow()
+        stmt = insert(table).values(
+            namespace=self.namespace,
+            session_key=key,
+            owner=owner,
+            payload=json.dumps(value, ensure_ascii=False),
+            expires_at=now + timedelta(seconds=ttl),
+            updated_at=now
+        )
+        stmt = stmt.on_duplicate_key_update(
+            owner=stmt.inserted.owner,
+            payload=stmt.inserted.payload,
+            expires_at=stmt.inserted.expires_at,
+            updated_at=stmt.inserted.updated_at
+        )
+        with self._engine().begin() as conn:
+            conn.execute(stmt)
+
+        if time.monotonic() - self._last_sweep >= SWEEP_INTERVAL:
+            self._last_sweep = time.monotonic()
+            self.sweep()
+
+    def delete(self, key: str) -> bool:
+        table = self._table()
+        with self._engine().begin() as conn:
+            result = conn.execute(
+                table.delete().where(
+                    table.c.namespace == self.namespace,
+                    table.c.session_key == key
+                )
+            )
+        return result.rowcount > 0
+
+    def list_by_owner(self, owner: str) -> dict:
+        table = self._table()
+        with self._engine().connect() as conn:
+            rows = conn.execute(
+                table.select().where(
+                    table.c.namespace == self.namespace,
+                    table.c.owner == owner,
+                    table.c.expires_at > datetime.utcnow()
+                )
+            ).all()
+        return {row.session_key: json.loads(row.payload) for row in rows}
+
+    def count_by_owner(self, owner: str) -> int:
+        from sqlalchemy import func, select
+        table = self._table()
+        with self._engine().connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(table).where(
+                    table.c.namespace == self.namespace,
+                    table.c.owner == owner,
+                    table.c.expires_at > datetime.utcnow()
+                )
+            ).scalar()
+
+    def count(self) -> int:
+        from sqlalchemy import func, select
+        table = self._table()
+        with self._engine().connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(table).where(
+                    table.c.namespace == self.namespace,
+                    table.c.expires_at > datetime.utcnow()
+                )
+            ).scalar()
+
+    def sweep(self, limit: int = SWEEP_BATCH_SIZE) -> list:
+        table = self._table()
+        now = datetime.utcnow()
+        with self._engine().begin() as conn:
+            keys = [row.session_key for row in conn.execute(
+                table.select().with_only_columns(table.c.session_key).where(
+                    table.c.namespace == self.namespace,
+                    table.c.expires_at <= now
+                ).order_by(table.c.expires_at).limit(limit)
+            )]
+            if keys:
+                conn.execute(
+                    table.delete().where(
+                        table.c.namespace == self.namespace,
+                        table.c.session_key.in_(keys),
+                        table.c.expires_at <= now
+                    )
+                )
+        return keys
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis 互換ストア（redis パッケージが必要）
+
+    期限は SET の EX で Redis 側に任せる。件数を数えるため、キーと期限を
+    {namespace}:expiry のソート済みセットにも持ち（スコアは期限の UNIX 時刻）、
+    count() はキー空間を走査せず期限内のメンバー数を返す。
+    期限切れのメンバーは sweep() でセットから取り除く。
+    """
+
+    def __init__(self, namespace: str, url: str = None):
+        super().__init__(namespace)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('SESSION_STORE_BACKEND=redis には redis パッケージが必要です') from e
+        self._client = redis.Redis.from_url(url or os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+
+    def _key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
+
+    def _owner_key(self, owner: str) -> str:
+        return f'{self.namespace}:owner:{owner}'
+
+    def _expiry_key(self) -> str:
+        return f'{self.namespace}:expiry'
+
+    def get(self, key: str):
+        raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: dict, ttl: float, owner: str = None):
+        pipe = self._client.pipeline()
+        ex = max(int(ttl), 1)
+        pipe.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=ex)
+        pipe.zadd(self._expiry_key(), {key: time.time() + ex})
+        if owner is not None:
+            pipe.sadd(self._owner_key(owner), key)
+        pipe.execute()
+
+    def delete(self, key: str) -> bool:
+        pipe = self._client.pipeline()
+        pipe.delete(self._key(key))
+        pipe.zrem(self._expiry_key(), key)
+        return pipe.execute()[0] > 0
+
+    def sweep(self, limit: int = SWEEP_BATCH_SIZE) -> list:
+        # 値は Redis 側で失効済みのため、期限のセットから取り除いてキーを返す。
+        # 取得と削除の間に set() で期限が延びたキーを消さないよう、同じ MULTI で実行する
+        # （一度に取り除く件数は limit で区切らない）
+        now = time.time()
+        pipe = self._client.pipeline(transaction=True)
+        pipe.zrangebyscore(self._expiry_key(), '-inf', now)
+        pipe.zremrangebyscore(self._expiry_key(), '-inf', now)
+        expired, _ = pipe.execute()
+        return [k.decode() if isinstance(k, bytes) else k for k in expired]
+
+    def list_by_owner(self, owner: str) -> dict:
+        keys = [k.decode() if isinstance(k, bytes) else k for k in self._client.smembers(self._owner_key(owner))]
+        if not keys:
+            return {}
+        values = self._client.mget([self._key(k) for k in keys])
+        # 失効済みのキーは所有者インデックスからも取り除く
+        stale = [k for k, v in zip(keys, values) if v is None]
+        if stale:
+            self._client.srem(self._owner_key(owner), *stale)
+        return {k: json.loads(v) for k, v in zip(keys, values) if v is not None}
+
+    def count_by_owner(self, owner: str) -> int:
+        keys = [k.decode() if isinstance(k, bytes) else k for k in self._client.smembers(self._owner_key(owner))]
+        if not keys:
+            return 0
+        pipe = self._client.pipeline()
+        for k in keys:
+            pipe.exists(self._key(k))
+        alive = pipe.execute()
+        stale = [k for k, exists in zip(keys, alive) if not exists]
+        if stale:
+            self._client.srem(self._owner_key(owner), *stale)
+        return len(keys) - len(stale)
+
+    def count(self) -> int:
+        return self._client.zcount(self._expiry_key(), f'({time.time()}', '+inf')
+
+
+def create_session_store(namespace: str, backend: str = None) -> SessionStore:
+    """環境変数（または引数）に応じたセッションストアを生成"""
+    backend = backend or SESSION_STORE_BACKEND
+    if backend == 'memory':
+        return InMemorySessionStore(namespace)
+    if backend == 'mysql':
+        return MySQLSessionStore(namespace)
+    if backend == 'redis':
+        return RedisSessionStore(namespace)
+    raise ValueError(f'Unknown SESSION_STORE_BACKEND: {backend}')
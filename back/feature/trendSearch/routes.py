@@ -5,6 +5,7 @@ import json
 from models.TrendSearchLog import TrendSearchLog
 from models.User import User
 from config.db import db
+from feature.userService.entitlements import require_service
 
 # search.pyから検索関数をインポート
 from .search import execute_full_search, get_search_health_status
@@ -17,6 +18,7 @@ def load_user(user_id):
 
 @trend_search_bp.route("/search", methods=["GET"])
 @login_required
+@require_service('aiSearch')
 def search():
     """
     メインの検索エンドポイント
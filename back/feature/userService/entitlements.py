@@ -0,0 +1,130 @@
+"""
+ユーザーごとのサービス利用権限（エンタイトルメント）のキャッシュ
+
+有効なサービス ID の frozenset をユーザーごとにメモリに保持し、
+my-services・check や各サービスの require_service で DB を引かずに判定する。
+- enable / disable などで権限を変更したら invalidate(user_id) でバージョンを上げる
+  （古いバージョンで読み込んだ結果はキャッシュに入らない）
+- 他のワーカーでの変更は ENTITLEMENT_CACHE_TTL 秒以内に反映される
+
+ロールによるアクセス制御（require_role）もここで提供する。ロールは load_user が
+User と同じクエリで読み込むため、判定に追加のクエリは発生しない。
+"""
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify
+from flask_login import current_user
+
+ENTITLEMENT_CACHE_TTL = float(os.environ.get('ENTITLEMENT_CACHE_TTL', '60'))
+ENTITLEMENT_CACHE_MAX_ENTRIES = int(os.environ.get('ENTITLEMENT_CACHE_MAX_ENTRIES', '10000'))
+
+
+def load_enabled_services(user_id: int) -> frozenset:
+    """DB から有効なサービス ID を読み込む"""
+    from config.db import db
+    from models.user_service import UserService
+    rows = db.session.query(UserService.service_id).filter_by(user_id=user_id, is_enabled=True).all()
+    return frozenset(row.service_id for row in rows)
+
+
+class EntitlementCache:
+    """user_id -> (バージョン, 期限, 有効なサービス ID の frozenset)"""
+
+    def __init__(self, loader=load_enabled_services, ttl: float = ENTITLEMENT_CACHE_TTL,
+                 max_entries: int = ENTITLEMENT_CACHE_MAX_ENTRIES):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id: int) -> frozenset:
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self.stats['hits'] += 1
+                return entry[2]
+            self.stats['misses'] += 1
+
+        services = self._loader(user_id)
+
+        with self._lock:
+            # 読み込み中に権限が変更された場合は、古い結果をキャッシュしない
+            if self._versions.get(user_id, 0) == version:
+                if user_id not in self._entries and len(self._entries) >= self.max_entries:
+                    self._evict_expired()
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.pop(next(iter(self._entries)))
+                self._entries[user_id] = (version, time.monotonic() + self.ttl, services)
+        return services
+
+    def has_service(self, user_id: int, service_id: str) -> bool:
+        return service_id in self.get(user_id)
+
+    def invalidate(self, *user_ids: int):
+        """権限を変更したユーザーのキャッシュを無効化"""
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                self._entries.pop(user_id, None)
+            self.stats['invalidations'] += len(user_ids)
+
+    def clear(self):
+        with self._lock:
+            for user_id in list(self._entries):
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for user_id in [uid for uid, entry in self._entries.items() if entry[1] <= now]:
+            del self._entries[user_id]
+
+
+entitlement_cache = EntitlementCache()
+
+
+def require_service(service_id: str):
+    """
+    サービスの利用権限があるユーザーのみ許可するデコレーター（@login_required の後に付ける）
+
+    Usage:
+        @crm_bp.route('/', methods=['GET'])
+        @login_required
+        @require_service('crm')
+        def get_customers(): ...
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not current_user.is_authenticated or not entitlement_cache.has_service(current_user.id, service_id):
+                return jsonify({'success': False, 'error': 'このサービスの利用権限がありません'}), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def require_role(*roles: str):
+    """
+    指定したロールのユーザーのみ許可するデコレーター（@login_required の後に付ける）
+
+    Usage:
+        @user_service_bp.route('/all-users', methods=['GET'])
+        @login_required
+        @require_role('admin')
+        def get_all_users(): ...
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not current_user.is_authenticated or current_user.role not in roles:
+                return jsonify({'success': False, 'error': '管理者権限が必要です' if roles == ('admin',) else 'この操作の権限がありません'}), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
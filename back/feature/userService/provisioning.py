@@ -0,0 +1,70 @@
+"""
+サービス利用権限の一括設定と、ユーザー作成時の初期設定
+
+- apply_entitlements: ユーザー × サービスの組み合わせを、チャンクごとに1回の
+  INSERT ... ON DUPLICATE KEY UPDATE で反映する
+- ユーザー作成時（users への INSERT 後）に、ロールと DEFAULT_SERVICES_BY_ROLE の
+  サービスを同じトランザクションで登録する
+"""
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import insert
+
+from models.User import User
+from models.user_service import UserService, UserRole
+from .entitlements import entitlement_cache
+
+# 1 文で書き込む行数の上限
+BULK_CHUNK_SIZE = 1000
+
+# ロールごとの初期サービス
+DEFAULT_SERVICES_BY_ROLE = {
+    'admin': ('tasks', 'crm', 'aiSearch', 'construction-schedule', '3d'),
+    'manager': ('tasks', 'crm', 'aiSearch', 'construction-schedule'),
+    'user': ('tasks', 'crm', 'aiSearch'),
+    'guest': ('tasks',),
+}
+DEFAULT_ROLE = 'user'
+
+
+def _upsert_statement(rows: list):
+    stmt = insert(UserService.__table__).values(rows)
+    return stmt.on_duplicate_key_update(
+        is_enabled=stmt.inserted.is_enabled,
+        updated_at=stmt.inserted.updated_at
+    )
+
+
+def apply_entitlements(connection, user_ids: list, service_ids: list, is_enabled: bool) -> int:
+    """
+    user_ids × service_ids の権限を is_enabled に設定し、対象の組み合わせ数を返す
+
+    connection は Connection / Session のどちらでもよい（コミットは呼び出し側で行う）。
+    """
+    now = datetime.utcnow()
+    rows = [
+        {'user_id': user_id, 'service_id': service_id, 'is_enabled': is_enabled,
+         'created_at': now, 'updated_at': now}
+        for user_id in user_ids
+        for service_id in service_ids
+    ]
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        connection.execute(_upsert_statement(rows[start:start + BULK_CHUNK_SIZE]))
+    return len(rows)
+
+
+@event.listens_for(User, 'after_insert')
+def _provision_new_user(mapper, connection, user):
+    """
+    ユーザー作成時にロールと初期サービスを登録
+
+    ロールは User に initial_role 属性を設定して指定できる（未指定は 'user'）。
+    """
+    role = getattr(user, 'initial_role', None) or DEFAULT_ROLE
+    if role not in DEFAULT_SERVICES_BY_ROLE:
+        raise ValueError(f'Unknown role: {role}')
+
+    connection.execute(UserRole.__table__.insert().values(user_id=user.id, role=role, created_at=datetime.utcnow()))
+    apply_entitlements(connection, [user.id], list(DEFAULT_SERVICES_BY_ROLE[role]), True)
+    entitlement_cache.invalidate(user.id)
@@ -3,8 +3,12 @@
 """
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import case, func, and_
 from models.user_service import UserService, UserRole
 from config.db import db
+from .entitlements import entitlement_cache, require_role
+from .provisioning import apply_entitlements
+from feature.login.routes import invalidate_user
 
 user_service_bp = Blueprint('user_service', __name__, url_prefix='/api/user-services')
 
@@ -52,28 +56,43 @@ AVAILABLE_SERVICES = {
     }
 }
 
+# my-services で返すサービス情報（リクエストごとにコピーしないよう起動時に作成）
+ACTIVE_SERVICE_INFO = {
+    service_id: {**service_info, 'status': 'active'}
+    for service_id, service_info in AVAILABLE_SERVICES.items()
+}
+
+
+# user_roles.role の値
+ROLES = ('admin', 'manager', 'user', 'guest')
+
+# 管理画面のサービス行列で使うビット位置（AVAILABLE_SERVICES の定義順）
+SERVICE_BITS = {service_id: 1 << index for index, service_id in enumerate(AVAILABLE_SERVICES)}
+
+# ユーザー一覧の1ページあたりの件数
+USERS_PAGE_DEFAULT_LIMIT = 100
+USERS_PAGE_MAX_LIMIT = 500
+
+
+def escape_like(value: str) -> str:
+    """LIKE のワイルドカード文字をエスケープ"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 
 @user_service_bp.route('/my-services', methods=['GET'])
 @login_required
 def get_my_services():
     """ログインユーザーが利用可能なサービス一覧を取得"""
     try:
-        # ユーザーのサービス権限を取得
-        user_services = UserService.query.filter_by(
-            user_id=current_user.id,
-            is_enabled=True
-        ).all()
+        # ユーザーのサービス権限を取得（キャッシュ）
+        enabled_service_ids = entitlement_cache.get(current_user.id)
         
-        # サービスIDのリストを取得
-        enabled_service_ids = [us.service_id for us in user_services]
-        
-        # 利用可能なサービス情報を構築
-        services = []
-        for service_id in enabled_service_ids:
-            if service_id in AVAILABLE_SERVICES:
-                service_info = AVAILABLE_SERVICES[service_id].copy()
-                service_info['status'] = 'active'
-                services.append(service_info)
+        # 利用可能なサービス情報を構築（定義順）
+        services = [
+            service_info
+            for service_id, service_info in ACTIVE_SERVICE_INFO.items()
+            if service_id in enabled_service_ids
+        ]
         
         return jsonify({
             'success': True,
@@ -86,26 +105,62 @@ def get_my_services():
 
 @user_service_bp.route('/all-users', methods=['GET'])
 @login_required
+@require_role('admin')
 def get_all_users():
-    """全ユーザー一覧を取得（管理者専用）"""
+    """
+    ユーザー一覧をサービスの有効状態付きで取得（管理者専用）
+    
+    Query params:
+        q: ユーザー名の前方一致検索
+        cursor: 前ページの next_cursor（このIDより後のユーザーを返す）
+        limit: 1ページの件数（既定100、最大500）
+    
+    各ユーザーの services_bitmap は service_bits のビットの論理和。
+    ユーザーとサービスの行列を1回の結合クエリで取得する。
+    """
     try:
-        # 管理者チェック（id=1のみ許可）
-        if current_user.id != 1:
-            return jsonify({'success': False, 'error': '管理者権限が必要です'}), 403
-        
         from models.User import User
-        users = User.query.all()
+        q = (request.args.get('q') or '').strip()
+        try:
+            cursor = int(request.args.get('cursor', 0))
+            limit = min(max(int(request.args.get('limit', USERS_PAGE_DEFAULT_LIMIT)), 1), USERS_PAGE_MAX_LIMIT)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'cursor / limit は数値で指定してください'}), 400
         
-        user_list = []
-        for user in users:
-            user_list.append({
-                'id': user.id,
-                'username': user.username
-            })
+        # (user_id, service_id) は一意なので、ビットの合計は論理和と等しい
+        bitmap = func.coalesce(func.sum(case(
+            *[(UserService.service_id == service_id, bit) for service_id, bit in SERVICE_BITS.items()],
+            else_=0
+        )), 0).label('services_bitmap')
+        
+        query = (
+            db.session.query(User.id, User.username, bitmap)
+            .outerjoin(UserService, and_(UserService.user_id == User.id, UserService.is_enabled.is_(True)))
+            .filter(User.id > cursor)
+        )
+        if q:
+            query = query.filter(User.username.like(f'{escape_like(q)}%', escape='\\'))
+        rows = query.group_by(User.id, User.username).order_by(User.id).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        user_list = [
+            {
+                'id': row.id,
+                'username': row.username,
+                'services_bitmap': int(row.services_bitmap),
+                'enabled_services': [sid for sid, bit in SERVICE_BITS.items() if int(row.services_bitmap) & bit]
+            }
+            for row in rows
+        ]
         
         return jsonify({
             'success': True,
-            'users': user_list
+            'users': user_list,
+            'service_bits': SERVICE_BITS,
+            'next_cursor': rows[-1].id if has_more else None,
+            'has_more': has_more
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -113,13 +168,10 @@ def get_all_users():
 
 @user_service_bp.route('/user/<int:user_id>/services', methods=['GET'])
 @login_required
+@require_role('admin')
 def get_user_services(user_id):
     """特定ユーザーのサービス一覧を取得（管理者専用）"""
     try:
-        # 管理者チェック（id=1のみ許可）
-        if current_user.id != 1:
-            return jsonify({'success': False, 'error': '管理者権限が必要です'}), 403
-        
         # ユーザーの存在確認
         from models.User import User
         user = User.query.get(user_id)
@@ -153,13 +205,10 @@ def get_user_services(user_id):
 
 @user_service_bp.route('/user/<int:user_id>/enable/<service_id>', methods=['POST'])
 @login_required
+@require_role('admin')
 def enable_service(user_id, service_id):
     """特定ユーザーのサービスを有効化（管理者専用）"""
     try:
-        # 管理者チェック（id=1のみ許可）
-        if current_user.id != 1:
-            return jsonify({'success': False, 'error': '管理者権限が必要です'}), 403
-        
         # ユーザーの存在確認
         from models.User import User
         user = User.query.get(user_id)
@@ -189,6 +238,7 @@ def enable_service(user_id, service_id):
             db.session.add(user_service)
         
         db.session.commit()
+        entitlement_cache.invalidate(user_id)
         
         return jsonify({
             'success': True,
@@ -202,13 +252,10 @@ def enable_service(user_id, service_id):
 
 @user_service_bp.route('/user/<int:user_id>/disable/<service_id>', methods=['POST'])
 @login_required
+@require_role('admin')
 def disable_service(user_id, service_id):
     """特定ユーザーのサービスを無効化（管理者専用）"""
     try:
-        # 管理者チェック（id=1のみ許可）
-        if current_user.id != 1:
-            return jsonify({'success': False, 'error': '管理者権限が必要です'}), 403
-        
         # ユーザーの存在確認
         from models.User import User
         user = User.query.get(user_id)
@@ -228,6 +275,7 @@ def disable_service(user_id, service_id):
         if user_service:
             user_service.is_enabled = False
             db.session.commit()
+            entitlement_cache.invalidate(user_id)
             
             return jsonify({
                 'success': True,
@@ -241,18 +289,111 @@ def disable_service(user_id, service_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# 一括設定で一度に指定できる組み合わせ数の上限
+BULK_MAX_PAIRS = 50000
+
+
+@user_service_bp.route('/bulk', methods=['POST'])
+@login_required
+@require_role('admin')
+def bulk_update_services():
+    """
+    複数ユーザー × 複数サービスの権限を一括設定（管理者専用）
+    
+    Request body:
+        {"user_ids": [2, 3, ...], "service_ids": ["crm", "tasks"], "is_enabled": true}
+    """
+    try:
+        data = request.get_json() or {}
+        user_ids = data.get('user_ids') or []
+        service_ids = data.get('service_ids') or []
+        is_enabled = data.get('is_enabled', True)
+        
+        if not isinstance(is_enabled, bool):
+            return jsonify({'success': False, 'error': 'is_enabled は true / false で指定してください'}), 400
+        if not user_ids or not service_ids:
+            return jsonify({'success': False, 'error': 'user_ids と service_ids を指定してください'}), 400
+        try:
+            user_ids = sorted({int(user_id) for user_id in user_ids})
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'user_ids は数値で指定してください'}), 400
+        
+        # サービスIDの検証
+        invalid_services = [sid for sid in service_ids if sid not in AVAILABLE_SERVICES]
+        if invalid_services:
+            return jsonify({'success': False, 'error': f'無効なサービスIDです: {", ".join(invalid_services)}'}), 400
+        service_ids = list(dict.fromkeys(service_ids))
+        
+        if len(user_ids) * len(service_ids) > BULK_MAX_PAIRS:
+            return jsonify({'success': False, 'error': f'一度に設定できるのは{BULK_MAX_PAIRS}件までです'}), 400
+        
+        # ユーザーの存在確認（1クエリ）
+        from models.User import User
+        existing_ids = {row.id for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+        missing_ids = [user_id for user_id in user_ids if user_id not in existing_ids]
+        if missing_ids:
+            return jsonify({'success': False, 'error': 'ユーザーが見つかりません', 'missing_user_ids': missing_ids}), 404
+        
+        updated = apply_entitlements(db.session, user_ids, service_ids, is_enabled)
+        db.session.commit()
+        entitlement_cache.invalidate(*user_ids)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{len(user_ids)}人のユーザーの{len(service_ids)}サービスを{"有効化" if is_enabled else "無効化"}しました',
+            'updated_count': updated,
+            'user_count': len(user_ids),
+            'service_ids': service_ids,
+            'is_enabled': is_enabled
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@user_service_bp.route('/user/<int:user_id>/role', methods=['PUT'])
+@login_required
+@require_role('admin')
+def update_user_role(user_id):
+    """特定ユーザーのロールを変更（管理者専用）"""
+    try:
+        data = request.get_json() or {}
+        role = data.get('role')
+        if role not in ROLES:
+            return jsonify({'success': False, 'error': f'role は {", ".join(ROLES)} のいずれかで指定してください'}), 400
+        
+        from models.User import User
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'success': False, 'error': 'ユーザーが見つかりません'}), 404
+        if user.id == current_user.id and role != 'admin':
+            return jsonify({'success': False, 'error': '自分自身の管理者権限は外せません'}), 400
+        
+        user_role = UserRole.query.filter_by(user_id=user_id).first()
+        if user_role:
+            user_role.role = role
+        else:
+            user_role = UserRole(user_id=user_id, role=role)
+            db.session.add(user_role)
+        db.session.commit()
+        invalidate_user(user_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{user.username}のロールを{role}に変更しました',
+            'role_info': user_role.to_dict()
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @user_service_bp.route('/check/<service_id>', methods=['GET'])
 @login_required
 def check_service_access(service_id):
     """特定のサービスへのアクセス権をチェック"""
     try:
-        user_service = UserService.query.filter_by(
-            user_id=current_user.id,
-            service_id=service_id,
-            is_enabled=True
-        ).first()
-        
-        has_access = user_service is not None
+        has_access = entitlement_cache.has_service(current_user.id, service_id)
         
         return jsonify({
             'success': True,
@@ -269,13 +410,12 @@ def check_service_access(service_id):
 def get_my_role():
     """ログインユーザーのロールを取得"""
     try:
-        user_role = UserRole.query.filter_by(user_id=current_user.id).first()
-        
-        if user_role:
+        # ロールは load_user でユーザーと一緒に読み込み済み
+        if current_user.role_info:
             return jsonify({
                 'success': True,
-                'role': user_role.role,
-                'role_info': user_role.to_dict()
+                'role': current_user.role,
+                'role_info': current_user.role_info
             })
         else:
             # デフォルトロール
@@ -294,5 +434,6 @@ def test_endpoint():
     return jsonify({
         'success': True,
         'message': 'User Service API is working!',
-        'available_services': list(AVAILABLE_SERVICES.keys())
+        'available_services': list(AVAILABLE_SERVICES.keys()),
+        'entitlement_cache': entitlement_cache.stats
     })
@@ -19,10 +19,12 @@ SELECT '⚠️  WARNING: All existing data will be deleted!' AS warning;
 
 SET FOREIGN_KEY_CHECKS = 0;
 
+DROP TABLE IF EXISTS `milestone_tombstones`;
 DROP TABLE IF EXISTS `milestone_history`;
 DROP TABLE IF EXISTS `milestone_dependencies`;
 DROP TABLE IF EXISTS `milestones`;
 DROP TABLE IF EXISTS `projects`;
+DROP TABLE IF EXISTS `shared_sessions`;
 DROP TABLE IF EXISTS `user_services`;
 DROP TABLE IF EXISTS `user_roles`;
 DROP TABLE IF EXISTS `trend_search_log`;
@@ -201,6 +203,7 @@ CREATE TABLE milestones (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     CONSTRAINT `fk_milestones_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE CASCADE,
     INDEX idx_project_order (project_id, display_order),
+    INDEX idx_project_updated (project_id, updated_at),
     INDEX idx_dates (start_date, end_date),
     INDEX idx_status (status),
     CONSTRAINT chk_progress CHECK (progress_percentage >= 0 AND progress_percentage <= 100)
@@ -236,6 +239,16 @@ CREATE TABLE milestone_history (
     INDEX idx_changed_at (changed_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='工程変更履歴';
 
+-- 1-5. 削除済み工程の墓標テーブル（ガントチャート差分同期用）
+CREATE TABLE milestone_tombstones (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    project_id INT NOT NULL COMMENT 'プロジェクトID',
+    milestone_id INT NOT NULL COMMENT '削除された工程ID',
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '削除日時',
+    CONSTRAINT `fk_milestone_tombstones_project` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`) ON DELETE CASCADE,
+    INDEX idx_project_deleted (project_id, deleted_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='削除済み工程（差分同期用）';
+
 SELECT '✅ Step 1: Construction Schedule tables created' AS status;
 
 -- ============================================================================
@@ -341,6 +354,9 @@ INSERT INTO user_roles (user_id, role)
 SELECT id, 'user' FROM users
 WHERE id NOT IN (SELECT user_id FROM user_roles);
 
+-- 管理者（これまで id=1 で判定していたユーザー）に admin ロールを設定
+UPDATE user_roles SET role = 'admin' WHERE user_id = 1;
+
 -- 3-4. 既存ユーザーに全サービスを有効化
 INSERT INTO user_services (user_id, service_id, is_enabled)
 SELECT u.id, 'tasks', TRUE FROM users u
@@ -372,6 +388,24 @@ SELECT '✅ Step 3: User services tables created' AS status;
 
 SELECT '✅ Step 4: TrendSearchLog table already created in Step 0' AS status;
 
+-- ============================================================================
+-- 4-2. 共有セッションテーブルの作成（sessionSync などのワーカー間共有用）
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS shared_sessions (
+    namespace VARCHAR(50) NOT NULL COMMENT '用途（webapp, capture など）',
+    session_key VARCHAR(255) NOT NULL COMMENT 'セッションキー',
+    owner VARCHAR(255) COMMENT '所有ユーザー',
+    payload TEXT NOT NULL COMMENT 'セッション情報（JSON）',
+    expires_at DATETIME NOT NULL COMMENT '有効期限（UTC）',
+    updated_at DATETIME COMMENT '更新日時（UTC）',
+    PRIMARY KEY (namespace, session_key),
+    INDEX idx_namespace_expires (namespace, expires_at),
+    INDEX idx_namespace_owner (namespace, owner)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='ワーカー間共有セッション';
+
+SELECT '✅ Step 4-2: Shared sessions table created' AS status;
+
 -- ============================================================================
 -- 5. サンプルデータの挿入（プロジェクトと工程）
 -- ============================================================================
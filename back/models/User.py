@@ -1,5 +1,6 @@
 from flask_login import UserMixin
 from config.db import db
+from models.user_service import UserRole
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
@@ -7,5 +8,13 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
 
+    # ロールはユーザーと同じクエリで結合して読み込む（load_user で user_roles を別に引かない）
+    role_entry = db.relationship(UserRole, uselist=False, lazy="joined", viewonly=True,
+                                 primaryjoin="User.id == foreign(UserRole.user_id)")
+
+    @property
+    def role(self):
+        return self.role_entry.role if self.role_entry else "user"
+
     def to_dict(self):
-        return {"id": self.id, "username": self.username, "password_hash": self.password_hash}
\ No newline at end of file
+        return {"id": self.id, "username": self.username, "password_hash": self.password_hash}
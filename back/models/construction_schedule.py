@@ -72,6 +72,11 @@ class Milestone(db.Model):
     # リレーション
     history = db.relationship('MilestoneHistory', backref='milestone', cascade='all, delete-orphan', lazy='dynamic')
     
+    # 差分同期（since=）用の複合インデックス
+    __table_args__ = (
+        db.Index('idx_project_updated', 'project_id', 'updated_at'),
+    )
+    
     def to_dict(self):
         """辞書形式に変換"""
         return {
@@ -154,3 +159,26 @@ class MilestoneHistory(db.Model):
             'changed_by': self.changed_by,
             'changed_at': self.changed_at.isoformat() if self.changed_at else None
         }
+
+
+class MilestoneTombstone(db.Model):
+    """削除済み工程の墓標モデル（ガントチャート差分同期用）"""
+    __tablename__ = 'milestone_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False, comment='プロジェクトID')
+    milestone_id = db.Column(db.Integer, nullable=False, comment='削除された工程ID')
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, comment='削除日時')
+    
+    __table_args__ = (
+        db.Index('idx_project_deleted', 'project_id', 'deleted_at'),
+    )
+    
+    def to_dict(self):
+        """辞書形式に変換"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'milestone_id': self.milestone_id,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None
+        }
@@ -0,0 +1,22 @@
+"""
+ワーカー間で共有するセッション情報のSQLAlchemyモデル
+"""
+from config.db import db
+from datetime import datetime
+
+
+class SharedSession(db.Model):
+    """有効期限付きの共有セッション（namespace ごとにキーを管理）"""
+    __tablename__ = 'shared_sessions'
+
+    namespace = db.Column(db.String(50), primary_key=True, comment='用途（webapp, capture など）')
+    session_key = db.Column(db.String(255), primary_key=True, comment='セッションキー')
+    owner = db.Column(db.String(255), comment='所有ユーザー')
+    payload = db.Column(db.Text, nullable=False, comment='セッション情報（JSON）')
+    expires_at = db.Column(db.DateTime, nullable=False, comment='有効期限（UTC）')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_namespace_expires', 'namespace', 'expires_at'),
+        db.Index('idx_namespace_owner', 'namespace', 'owner'),
+    )
@@ -16,7 +16,7 @@ const Service: React.FC = () => {
       try {
         // 管理者チェック
         const user = await currentUser();
-        setIsAdmin(user.id === 1);
+        setIsAdmin(user.role === 'admin');
         
         // サービス一覧を取得
         const data = await getMyServices();
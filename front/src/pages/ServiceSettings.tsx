@@ -1,11 +1,19 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getAllUsers, getUserServices, enableUserService, disableUserService, User, ServiceItemWithStatus } from '../services/userService';
+import { getUsersPage, getUserServices, enableUserService, disableUserService, User, ServiceItemWithStatus } from '../services/userService';
 import { currentUser } from '../services/login';
 
+// ユーザー一覧を1回に取得する件数
+const USERS_PAGE_SIZE = 50;
+
 const ServiceSettings: React.FC = () => {
   const navigate = useNavigate();
   const [users, setUsers] = useState<User[]>([]);
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
+  const [query, setQuery] = useState('');
+  // 表示中の一覧の検索条件（入力途中の query ではなく、検索した時点の値で続きを取得する）
+  const [appliedQuery, setAppliedQuery] = useState('');
+  const [loadingUsers, setLoadingUsers] = useState(false);
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
   const [services, setServices] = useState<ServiceItemWithStatus[]>([]);
   const [loading, setLoading] = useState(true);
@@ -19,19 +27,20 @@ const ServiceSettings: React.FC = () => {
     try {
       // 管理者チェック
       const user = await currentUser();
-      if (user.id !== 1) {
+      if (user.role !== 'admin') {
         alert('管理者権限が必要です');
         navigate('/service');
         return;
       }
       
-      // ユーザー一覧を取得
-      const userList = await getAllUsers();
-      setUsers(userList);
+      // ユーザー一覧の最初のページを取得
+      const page = await getUsersPage({ limit: USERS_PAGE_SIZE });
+      setUsers(page.users);
+      setNextCursor(page.nextCursor);
       
       // 最初のユーザーを選択
-      if (userList.length > 0) {
-        await loadUserServices(userList[0]);
+      if (page.users.length > 0) {
+        await loadUserServices(page.users[0]);
       }
     } catch (error) {
       console.error('エラー:', error);
@@ -41,6 +50,40 @@ const ServiceSettings: React.FC = () => {
     }
   };
 
+  // ユーザー名で検索（前方一致）し、一覧を最初のページから取り直す
+  const searchUsers = async (e: React.FormEvent) => {
+    e.preventDefault();
+    setLoadingUsers(true);
+    try {
+      const q = query.trim();
+      const page = await getUsersPage({ q, limit: USERS_PAGE_SIZE });
+      setUsers(page.users);
+      setNextCursor(page.nextCursor);
+      setAppliedQuery(q);
+    } catch (error) {
+      console.error('ユーザー取得エラー:', error);
+      alert('ユーザーの取得に失敗しました');
+    } finally {
+      setLoadingUsers(false);
+    }
+  };
+
+  // 次のページを取得して一覧に追加
+  const loadMoreUsers = async () => {
+    if (nextCursor === null) return;
+    setLoadingUsers(true);
+    try {
+      const page = await getUsersPage({ q: appliedQuery, cursor: nextCursor, limit: USERS_PAGE_SIZE });
+      setUsers((prev) => [...prev, ...page.users]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('ユーザー取得エラー:', error);
+      alert('ユーザーの取得に失敗しました');
+    } finally {
+      setLoadingUsers(false);
+    }
+  };
+
   const loadUserServices = async (user: User) => {
     try {
       setSelectedUser(user);
@@ -102,6 +145,22 @@ const ServiceSettings: React.FC = () => {
           <div className="lg:col-span-1">
             <div className="bg-white rounded-lg shadow p-4">
               <h2 className="text-lg font-bold text-gray-900 mb-4">ユーザー一覧</h2>
+              <form onSubmit={searchUsers} className="flex gap-2 mb-4">
+                <input
+                  type="text"
+                  value={query}
+                  onChange={(e) => setQuery(e.target.value)}
+                  placeholder="ユーザー名で検索"
+                  className="flex-1 min-w-0 px-3 py-2 border border-gray-300 rounded-lg text-sm"
+                />
+                <button
+                  type="submit"
+                  disabled={loadingUsers}
+                  className="px-3 py-2 bg-blue-600 text-white rounded-lg text-sm hover:bg-blue-700 disabled:opacity-50"
+                >
+                  検索
+                </button>
+              </form>
               <div className="space-y-2">
                 {users.map((user) => (
                   <button
@@ -119,7 +178,19 @@ const ServiceSettings: React.FC = () => {
                     </div>
                   </button>
                 ))}
+                {users.length === 0 && !loadingUsers && (
+                  <p className="text-sm text-gray-500 text-center py-4">ユーザーが見つかりません</p>
+                )}
               </div>
+              {nextCursor !== null && (
+                <button
+                  onClick={loadMoreUsers}
+                  disabled={loadingUsers}
+                  className="w-full mt-4 px-4 py-2 text-sm text-blue-600 border border-blue-200 rounded-lg hover:bg-blue-50 disabled:opacity-50"
+                >
+                  {loadingUsers ? '読み込み中...' : 'さらに読み込む'}
+                </button>
+              )}
             </div>
           </div>
 
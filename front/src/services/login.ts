@@ -3,6 +3,8 @@ import API_BASE_URL from "../config/api";
 export interface CurrentUser {
   id: number;
   username: string;
+  role?: "admin" | "manager" | "user" | "guest";
+  services?: string[];
 }
 
 export const login = async (username: string, password: string): Promise<{ message: string }> => {
@@ -18,6 +18,8 @@ export interface ServiceItemWithStatus extends ServiceItem {
 export interface User {
   id: number;
   username: string;
+  services_bitmap?: number;
+  enabled_services?: string[];
 }
 
 interface ServiceResponse {
@@ -30,6 +32,8 @@ interface ServiceResponse {
 interface UsersResponse {
   success: boolean;
   users?: User[];
+  next_cursor?: number | null;
+  has_more?: boolean;
   error?: string;
 }
 
@@ -53,15 +57,22 @@ export const getMyServices = async (): Promise<ServiceItem[]> => {
   throw new Error(data.error || 'サービスの取得に失敗しました');
 };
 
-// 全ユーザー一覧を取得（管理者専用）
-export const getAllUsers = async (): Promise<User[]> => {
-  const res = await fetch(`${API_BASE_URL}/user-services/all-users`, {
+// ユーザー一覧を1ページ取得（管理者専用、q はユーザー名の前方一致）
+export const getUsersPage = async (
+  params: { q?: string; cursor?: number | null; limit?: number } = {}
+): Promise<{ users: User[]; nextCursor: number | null }> => {
+  const query = new URLSearchParams();
+  if (params.q) query.set('q', params.q);
+  if (params.cursor) query.set('cursor', String(params.cursor));
+  if (params.limit) query.set('limit', String(params.limit));
+  
+  const res = await fetch(`${API_BASE_URL}/user-services/all-users?${query.toString()}`, {
     credentials: 'include'
   });
   const data: UsersResponse = await res.json();
   
   if (data.success && data.users) {
-    return data.users;
+    return { users: data.users, nextCursor: data.next_cursor ?? null };
   }
   throw new Error(data.error || 'ユーザーの取得に失敗しました');
 };